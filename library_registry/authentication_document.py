@@ -1,6 +1,7 @@
 import json
 from collections import defaultdict
 
+import orjson
 from flask_babel import lazy_gettext as lgt
 from sqlalchemy.orm.exc import MultipleResultsFound, NoResultFound
 from sqlalchemy.orm.session import Session
@@ -60,6 +61,7 @@ class AuthenticationDocument:
         )
 
         self.links = links
+        self.links_by_rel = self._index_links(links)
         self.website = self.extract_link(rel="alternate", require_type="text/html")
         self.online_registration = self.has_link(rel="register")
         self.root = self.extract_link(rel="start", prefer_type=OPDS_CATALOG_MEDIA_TYPE)
@@ -92,7 +94,10 @@ class AuthenticationDocument:
         :param require_type: The link must have this as its type.
         :param prefer_type: A link with this type is better than a link of some other type.
         """
-        return self._extract_link(self.links, rel, require_type, prefer_type)
+        if require_type and prefer_type:
+            raise ValueError("At most one of require_type and prefer_type may be specified.")
+
+        return self._select_link(self.links_by_rel.get(rel, []), require_type, prefer_type)
 
     def has_link(self, rel):
         """
@@ -103,7 +108,7 @@ class AuthenticationDocument:
         :rel: The link must have this link relation.
         :return: True if there is a link with the link relation in the document, False otherwise.
         """
-        if self._extract_link(self.links, rel):
+        if rel in self.links_by_rel:
             return True
 
         # We couldn't find a matching link in the main set of links, but maybe there's a matching
@@ -161,20 +166,23 @@ class AuthenticationDocument:
     ##### Class Methods ######################################################  # noqa: E266
     @classmethod
     def parse_service_and_focus_area(cls, _db, service_area, focus_area, place_class=Place):
+        # The two areas almost always name the same nations, so share the nation lookups between them.
+        nations = {}
+
         if service_area:
-            service_area = cls.parse_coverage(_db, service_area, place_class=place_class)
+            service_area = cls.parse_coverage(_db, service_area, place_class=place_class, nations=nations)
         else:
             service_area = [place_class.everywhere(_db)], {}, {}
 
         if focus_area:
-            focus_area = cls.parse_coverage(_db, focus_area, place_class=place_class)
+            focus_area = cls.parse_coverage(_db, focus_area, place_class=place_class, nations=nations)
         else:
             focus_area = service_area
 
         return service_area, focus_area
 
     @classmethod
-    def parse_coverage(cls, _db, coverage, place_class=Place):
+    def parse_coverage(cls, _db, coverage, place_class=Place, nations=None):
         """
         Derive Place objects from an Authentication For OPDS coverage object
         (i.e. a value for `service_area` or `focus_area`)
@@ -183,6 +191,9 @@ class AuthenticationDocument:
 
         :param place_class: In unit tests, pass in a mock replacement for the Place class here.
 
+        :param nations: An optional dictionary of nation names to the nations they were already
+            found to refer to. Nations found by this call are added to it.
+
         :return: A 3-tuple (places, unknown, ambiguous).
 
         `places` is a list of Place model objects.
@@ -196,6 +207,8 @@ class AuthenticationDocument:
         place_objs = []
         unknown = defaultdict(list)
         ambiguous = defaultdict(list)
+        if nations is None:
+            nations = {}
 
         if coverage == cls.COVERAGE_EVERYWHERE:     # This library covers the entire universe! No need to parse.
             place_objs.append(place_class.everywhere(_db))
@@ -215,7 +228,10 @@ class AuthenticationDocument:
 
         for nation, places in list(coverage.items()):
             try:
-                nation_obj = place_class.lookup_one_by_name(_db, nation, place_type=Place.NATION)
+                nation_obj = nations.get(nation)
+                if nation_obj is None:
+                    nation_obj = place_class.lookup_one_by_name(_db, nation, place_type=Place.NATION)
+                    nations[nation] = nation_obj
 
                 if places == cls.COVERAGE_EVERYWHERE:   # This library covers an entire nation.
                     place_objs.append(nation_obj)
@@ -244,7 +260,7 @@ class AuthenticationDocument:
 
     @classmethod
     def from_string(cls, _db, s, place_class=Place):
-        data = json.loads(s)
+        data = orjson.loads(s)     # Accepts the raw bytes of an HTTP response without a decode step
         return cls.from_dict(_db, data, place_class)
 
     @classmethod
@@ -396,6 +412,23 @@ class AuthenticationDocument:
 
         library.audiences = audience_objs
 
+    @classmethod
+    def _index_links(cls, links):
+        """
+        Group a list of links by link relation, so each relation can be looked up without a scan.
+
+        :return: A dictionary mapping each link relation to its links, in document order.
+        """
+        links_by_rel = defaultdict(list)
+
+        if not links or not isinstance(links, list):
+            return {}       # No links, or an invalid links object; ignore it.
+
+        for link in links:
+            links_by_rel[link.get('rel')].append(link)
+
+        return dict(links_by_rel)
+
     @classmethod
     def _extract_link(cls, links, rel, require_type=None, prefer_type=None):
         if require_type and prefer_type:
@@ -404,15 +437,22 @@ class AuthenticationDocument:
         if not links:
             return None     # There are no links, period.
 
-        good_enough = None
-
         if not isinstance(links, list):
             return          # Invalid links object; ignore it.
 
-        for link in links:
-            if rel != link.get('rel'):
-                continue
+        return cls._select_link([link for link in links if rel == link.get('rel')], require_type, prefer_type)
+
+    @classmethod
+    def _select_link(cls, links, require_type=None, prefer_type=None):
+        """
+        Choose the best of a list of links that share a link relation.
 
+        :param require_type: The link must have this as its type.
+        :param prefer_type: A link with this type is better than a link of some other type.
+        """
+        good_enough = None
+
+        for link in links:
             if not require_type and not prefer_type:
                 return link     # Any link with this relation will work. Return the first one we see.
 
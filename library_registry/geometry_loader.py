@@ -51,10 +51,16 @@ class GeometryLoader:
 
         # We only ever add aliases. If the database contains an alias for this place that doesn't
         # show up in the metadata, it may have been created manually.
-        for alias in aliases:
-            (alias, _) = get_one_or_create(
-                self._db, PlaceAlias, place=place, name=alias['name'], language=alias['language']
-            )
+        if is_new:
+            # A brand new place has no aliases to look up, so just add them (once each), and let them
+            # be inserted along with everything else at the next flush.
+            for (alias_name, alias_language) in dict.fromkeys((x['name'], x['language']) for x in aliases):
+                self._db.add(PlaceAlias(place=place, name=alias_name, language=alias_language))
+        else:
+            for alias in aliases:
+                (alias, _) = get_one_or_create(
+                    self._db, PlaceAlias, place=place, name=alias['name'], language=alias['language']
+                )
 
         self.places_by_external_id[external_id] = place
 
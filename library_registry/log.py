@@ -1,4 +1,5 @@
 import datetime
+import functools
 import logging
 import json
 import socket
@@ -144,15 +145,23 @@ class LogConfiguration:
         from library_registry.model import ExternalIntegration
 
         if _db and not testing:
-            goal = ExternalIntegration.LOGGING_GOAL
-            internal = ExternalIntegration.lookup(_db, ExternalIntegration.INTERNAL_LOGGING, goal)
-            loggly = ExternalIntegration.lookup(_db, ExternalIntegration.LOGGLY, goal)
+            # Fetch every logging integration in one query. ExternalIntegration.settings is
+            # eagerly joined, so their settings come back with them.
+            by_protocol = ExternalIntegration.lookup_by_goal(_db, ExternalIntegration.LOGGING_GOAL)
+            internal = by_protocol.get(ExternalIntegration.INTERNAL_LOGGING)
+            loggly = by_protocol.get(ExternalIntegration.LOGGLY)
 
             if internal:
-                internal_log_level = internal.setting(cls.LOG_LEVEL).setdefault(internal_log_level)
-                internal_log_format = internal.setting(cls.LOG_FORMAT).setdefault(internal_log_format)
-                database_log_level = internal.setting(cls.DATABASE_LOG_LEVEL).setdefault(database_log_level)
-                message_template = internal.setting(cls.LOG_MESSAGE_TEMPLATE).setdefault(message_template)
+                loaded = {setting.key: setting for setting in internal.settings if setting.library_id is None}
+
+                def setting(key):
+                    # Only go back to the database when a setting doesn't exist yet and has to be created.
+                    return loaded.get(key) or internal.setting(key)
+
+                internal_log_level = setting(cls.LOG_LEVEL).setdefault(internal_log_level)
+                internal_log_format = setting(cls.LOG_FORMAT).setdefault(internal_log_format)
+                database_log_level = setting(cls.DATABASE_LOG_LEVEL).setdefault(database_log_level)
+                message_template = setting(cls.LOG_MESSAGE_TEMPLATE).setdefault(message_template)
 
             if loggly:
                 handlers.append(cls.loggly_handler(loggly))
@@ -204,8 +213,13 @@ class LogConfiguration:
         return url  # Assume the token is already in the URL.
 
     @classmethod
+    @functools.lru_cache(maxsize=None)
     def _defaults(cls, testing=False):
-        """Return default log configuration values."""
+        """
+        Return default log configuration values.
+
+        The result depends only on `testing`, so it's computed once per value and cached.
+        """
         if testing:
             internal_log_level = 'DEBUG'
             internal_log_format = cls.TEXT_LOG_FORMAT
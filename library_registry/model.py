@@ -3,10 +3,11 @@ import logging
 import random
 import re
 import string
+import time
 import uuid
 import warnings
 from collections import defaultdict
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 
 import uszipcode
 from flask_babel import lazy_gettext as lgt
@@ -14,13 +15,14 @@ from flask_bcrypt import check_password_hash, generate_password_hash
 from geoalchemy2 import Geography, Geometry
 from sqlalchemy import (Boolean, Column, DateTime, Enum, ForeignKey, Index,
                         Integer, String, Table, Unicode, UniqueConstraint,
-                        create_engine)
+                        case, create_engine, inspect)
 from sqlalchemy import exc as sa_exc
-from sqlalchemy import func
+from sqlalchemy import bindparam, func
+from sqlalchemy.ext import baked
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.ext.hybrid import hybrid_property
-from sqlalchemy.orm import (aliased, backref, relationship, sessionmaker,
-                            validates)
+from sqlalchemy.orm import (aliased, backref, relationship, scoped_session,
+                            selectinload, sessionmaker, validates)
 from sqlalchemy.orm.exc import MultipleResultsFound
 from sqlalchemy.orm.session import Session
 from sqlalchemy.sql.expression import (and_, cast, or_, select)
@@ -45,6 +47,9 @@ from library_registry.util.language import LanguageCodes
 DEBUG = False
 Base = declarative_base()
 
+# Cache of compiled queries for lookups that run on hot paths with only their parameters changing.
+bakery = baked.bakery()
+
 
 def production_session():
     url = Configuration.database_url()
@@ -123,7 +128,6 @@ class Library(Base):
     PRODUCTION_STAGE    = 'production'  # Library should show up in production feed     # noqa: E221
     CANCELLED_STAGE     = 'cancelled'   # Library should not show up in any feed        # noqa: E221
     PLS_ID              = "pls_id"      # Public Library Surveys ID                     # noqa: E221
-    WHITESPACE_REGEX    = re.compile(r"\s+")                                            # noqa: E221
 
     ##### Public Interface / Magic Methods ###################################  # noqa: E266
 
@@ -136,6 +140,9 @@ class Library(Base):
         first item in `hrefs` will be used as the basis for a new Hyperlink, or an existing
         Hyperlink will be modified to use the first item in `hrefs` as its Resource.
 
+        If the Library's hyperlinks are already loaded, the existing Hyperlink is found among them.
+        Otherwise only the Hyperlink for `rel` is looked up, not the whole collection.
+
         :return: A 2-tuple (Hyperlink, is_modified). `is_modified` is True if a new Hyperlink was
             created _or_ an existing Hyperlink was modified.
         """
@@ -146,10 +153,19 @@ class Library(Base):
             raise ValueError("No Hyperlink hrefs were specified")
 
         default_href = hrefs[0]
-        _db = Session.object_session(self)
-        (hyperlink, is_modified) = get_one_or_create(_db, Hyperlink, library=self, rel=rel,)
+        href_set = frozenset(hrefs)
+
+        hyperlink = None
+        if 'hyperlinks' not in inspect(self).unloaded:
+            hyperlink = Library.get_hyperlink(self, rel)
+
+        if hyperlink:
+            is_modified = False
+        else:
+            _db = Session.object_session(self)
+            (hyperlink, is_modified) = get_one_or_create(_db, Hyperlink, library=self, rel=rel,)
 
-        if hyperlink.href not in hrefs:
+        if hyperlink.href not in href_set:
             hyperlink.href = default_href
             is_modified = True
 
@@ -196,12 +212,15 @@ class Library(Base):
 
     @validates('short_name')
     def validate_short_name(self, key, value):
+        """Short names are normalized to uppercase once, when they're set, so reads never need to."""
         if not value:
             return value
         if '|' in value:
             raise ValueError(
                 'Short name cannot contain the pipe character.'
             )
+        if value.isupper():     # Generated and previously-stored names are already uppercase.
+            return value
         return value.upper()
 
     ##### Properties and Getters/Setters #####################################  # noqa: E266
@@ -223,24 +242,42 @@ class Library(Base):
     def pls_id(self):
         return ConfigurationSetting.for_library(Library.PLS_ID, self)
 
-    @property
+    @hybrid_property
     def number_of_patrons(self):
         db = Session.object_session(self)
 
         if not self.in_production:
             return 0  # Count is only meaningful if the library is in production
 
-        query = db.query(DelegatedPatronIdentifier).filter(
+        # Count in a single aggregate, rather than with Query.count(), which wraps the full row query
+        # in a subquery and counts that. count(*) needs no column from the rows themselves, so it can be
+        # answered from the (type, library_id, patron_identifier) unique index alone.
+        query = db.query(func.count()).select_from(DelegatedPatronIdentifier).filter(
             DelegatedPatronIdentifier.type == DelegatedPatronIdentifier.ADOBE_ACCOUNT_ID,
             DelegatedPatronIdentifier.library_id == self.id
         )
 
-        return query.count()
+        return query.scalar()
 
-    @property
+    @number_of_patrons.expression
+    def number_of_patrons(cls):
+        """SQL form of .number_of_patrons, so it can be selected alongside other Library columns in one query."""
+        patron_count = select([func.count()]).select_from(DelegatedPatronIdentifier).where(
+            and_(DelegatedPatronIdentifier.type == DelegatedPatronIdentifier.ADOBE_ACCOUNT_ID,
+                 DelegatedPatronIdentifier.library_id == cls.id)
+        ).as_scalar()
+
+        return case([(cls.in_production, patron_count)], else_=0)
+
+    @hybrid_property
     def in_production(self):
         """Is this library in production? If library and registry agree on production, it is."""
-        return bool(self.library_stage == self.PRODUCTION_STAGE and self.registry_stage == self.PRODUCTION_STAGE)
+        return self.registry_stage == self.PRODUCTION_STAGE and self._library_stage == self.PRODUCTION_STAGE
+
+    @in_production.expression
+    def in_production(cls):
+        """SQL form of .in_production. It's the same restriction as the production feed's."""
+        return cls._feed_restriction(production=True)
 
     @property
     def types(self):
@@ -321,12 +358,16 @@ class Library(Base):
     @classmethod
     def for_short_name(cls, _db, short_name):
         """Look up a library by short name."""
-        return get_one(_db, Library, short_name=short_name)
+        baked_query = bakery(lambda session: session.query(Library))
+        baked_query += lambda q: q.filter(Library.short_name == bindparam('short_name'))
+        return baked_query(_db).params(short_name=short_name).one_or_none()
 
     @classmethod
     def for_urn(cls, _db, urn):
         """Look up a library by URN."""
-        return get_one(_db, Library, internal_urn=urn)
+        baked_query = bakery(lambda session: session.query(Library))
+        baked_query += lambda q: q.filter(Library.internal_urn == bindparam('internal_urn'))
+        return baked_query(_db).params(internal_urn=urn).one_or_none()
 
     @classmethod
     def random_short_name(cls, duplicate_check=None, max_attempts=20):
@@ -341,7 +382,7 @@ class Library(Base):
         attempts = 0
         choice = None
         while not choice and attempts < max_attempts:
-            choice = "".join([random.choice(string.ascii_uppercase) for i in range(6)])
+            choice = "".join(random.choices(string.ascii_uppercase, k=6))
 
             if callable(duplicate_check) and duplicate_check(choice):
                 choice = None
@@ -364,12 +405,15 @@ class Library(Base):
         """
         # The concept of 'patron count' only makes sense for production libraries.
         library_ids = [lib.id for lib in libraries if lib.in_production]
+        if not library_ids:
+            return {}
 
-        # Run the SQL query.
+        # Run the SQL query. Like .number_of_patrons, this counts rows rather than ids, so the
+        # (type, library_id, patron_identifier) unique index can answer it without visiting the table.
         counts = select(
             [
                 DelegatedPatronIdentifier.library_id,
-                func.count(DelegatedPatronIdentifier.id)
+                func.count()
             ],
         ).where(
             and_(DelegatedPatronIdentifier.type == DelegatedPatronIdentifier.ADOBE_ACCOUNT_ID,
@@ -429,7 +473,7 @@ class Library(Base):
         # For each library served by such a place, calculate the
         # minimum distance between the library's service area and
         # Point A in meters.
-        min_distance = func.min(func.ST_DistanceSphere(target, Place.geometry))
+        min_distance = func.min(func.ST_DistanceSphere(target, Place.geometry)).label("distance")
 
         qu = _db.query(Library).join(Library.service_areas).join(
             ServiceArea.place)
@@ -438,7 +482,8 @@ class Library(Base):
         qu = qu.add_columns(
                 min_distance).group_by(Library.id).order_by(
                 min_distance.asc())
-        return qu
+
+        return qu.options(*cls._catalog_loader_options())
 
     @classmethod
     def search(cls, _db, target, query, production=True):
@@ -486,35 +531,23 @@ class Library(Base):
         else:
             libraries_for_location = []
 
-        if libraries_for_name and libraries_for_location:
-            # Filter out any libraries that show up in both lists.
-            for_name = set(libraries_for_name)
-            libraries_for_location = [
-                x for x in libraries_for_location if x not in for_name
-            ]
-
         # A lot of libraries list their locations only within their description, so it's worth
         # checking the description for the search term.
         libraries_for_description = cls.search_within_description(
             _db, query, here, production
         ).limit(max_libraries).all()
 
+        # Keep only the first appearance of each library, so a library that matches by name isn't
+        # repeated as a location or description match.
         all_results = libraries_for_name + libraries_for_location + libraries_for_description
-        unique_library_ids = []
+        unique_library_ids = set()
         unique_results = []
-        for library in all_results:
-            # Sometimes a 'library' in the list is a Library instance, sometimes it's a 2-tuple,
-            # of Library instance and distance.
+        for result in all_results:
+            # Sometimes a result is a Library instance, sometimes it's a 2-tuple of Library instance and distance.
+            library = result[0] if isinstance(result, tuple) else result
             if isinstance(library, Library) and library.id not in unique_library_ids:
-                unique_library_ids.append(library.id)
-                unique_results.append(library)
-            elif (
-                    isinstance(library, tuple)
-                    and isinstance(library[0], Library)
-                    and library[0].id not in unique_library_ids
-            ):
-                unique_library_ids.append(library[0].id)
-                unique_results.append(library)
+                unique_library_ids.add(library.id)
+                unique_results.append(result)
 
         return unique_results
 
@@ -560,16 +593,14 @@ class Library(Base):
             qu = qu.filter(named_place.type == type)
 
         if here:
-            min_distance = func.min(func.ST_DistanceSphere(here, named_place.geometry))
+            min_distance = func.min(func.ST_DistanceSphere(here, named_place.geometry)).label("distance")
             qu = qu.add_columns(min_distance)
             qu = qu.group_by(Library.id)
             qu = qu.order_by(min_distance.asc())
 
-        return qu
+        return qu.options(*cls._catalog_loader_options())
 
-    us_zip = re.compile("^[0-9]{5}$")
-    us_zip_plus_4 = re.compile("^[0-9]{5}-[0-9]{4}$")
-    running_whitespace = re.compile(r"\s+")
+    us_zip = re.compile("^([0-9]{5})(?:-[0-9]{4})?$")     # A ZIP code, optionally in ZIP+4 form
 
     @classmethod
     def create_query(cls, _db, here=None, production=True, *args):
@@ -584,12 +615,12 @@ class Library(Base):
         if here:
             # Order by the minimum distance between one of the
             # library's service areas and the current location.
-            min_distance = func.min(func.ST_DistanceSphere(here, Place.geometry))
+            min_distance = func.min(func.ST_DistanceSphere(here, Place.geometry)).label("distance")
             qu = qu.add_columns(min_distance)
             qu = qu.group_by(Library.id)
             qu = qu.order_by(min_distance.asc())
 
-        return qu
+        return qu.options(*cls._catalog_loader_options())
 
     @classmethod
     def search_within_description(cls, _db, query, here=None, production=True):
@@ -608,20 +639,17 @@ class Library(Base):
     def query_cleanup(cls, query):
         """Clean up a query."""
         query = query.lower()
-        query = cls.WHITESPACE_REGEX.sub(" ", query).strip()
+        query = " ".join(query.split())     # Collapse runs of whitespace, and trim it from both ends
         query = query.replace("libary", "library")  # Correct the most common misspelling of 'library'
         return query
 
     @classmethod
     def as_postal_code(cls, query):
         """Try to interpret a query as a postal code."""
-        if cls.us_zip.match(query):
-            return query
-
-        match = cls.us_zip_plus_4.match(query)
+        match = cls.us_zip.match(query)
 
         if match:
-            return query[:5]
+            return match.group(1)
 
     @classmethod
     def query_parts(cls, query):
@@ -664,10 +692,17 @@ class Library(Base):
         If the field's value is less than six characters, we require an exact (case-insensitive) match.
         Otherwise, we require a Levenshtein distance of less than two between the field value and
         the provided value.
+
+        Two strings can't be within that distance unless their lengths are too, so the clause checks
+        length first, which spares the database from computing a distance for every row. For the rows
+        that remain, levenshtein_less_equal() stops as soon as the distance is known to exceed the limit,
+        rather than filling in the whole edit-distance table.
         """
+        max_distance = 2
         is_long = func.length(field) >= 6
-        close_enough = func.levenshtein(func.lower(field), value) <= 2
-        long_value_is_approximate_match = (is_long & close_enough)
+        similar_length = func.length(field).between(len(value) - max_distance, len(value) + max_distance)
+        close_enough = func.levenshtein_less_equal(func.lower(field), value, max_distance) <= max_distance
+        long_value_is_approximate_match = (is_long & similar_length & close_enough)
         exact_match = field.ilike(value)
         return or_(long_value_is_approximate_match, exact_match)
 
@@ -711,6 +746,20 @@ class Library(Base):
         else:               # Both must agree library is in _either_ prod stage or test stage
             return and_(library_field.in_((prod, test)), registry_field.in_((prod, test)))
 
+    @classmethod
+    def _catalog_loader_options(cls):
+        """
+        Loader options for queries whose results usually end up in an OPDS catalog.
+
+        A catalog entry looks at each library's service areas (and their places) and at each of its
+        hyperlinks' resources and validations. Load those for every library in the result with a few
+        extra queries, rather than a few extra queries per library.
+        """
+        return (
+            selectinload(Library.service_areas).selectinload(ServiceArea.place),
+            selectinload(Library.hyperlinks).selectinload(Hyperlink.resource).selectinload(Resource.validation),
+        )
+
 
 class LibraryAlias(Base):
     """An alternate name for a library."""
@@ -1388,7 +1437,12 @@ class CollectionSummary(Base):
         # This also covers the case where the library specifies its collection size but doesn't mention any languages.
         language_code = LanguageCodes.string_to_alpha_3(language)
 
-        (summary, _) = get_one_or_create(_db, CollectionSummary, library=library, language=language_code)
+        # A library only has a handful of collections, and callers set several of them in a row, so look for an
+        # existing summary among the library's collections rather than querying for each language.
+        summary = next((x for x in library.collections if x.language == language_code), None)
+        if summary is None:
+            (summary, _) = create(_db, CollectionSummary, library=library, language=language_code)
+
         summary.size = size
 
         return summary
@@ -1593,6 +1647,10 @@ class Validation(Base):
     INACTIVE = "https://schema.org/ReservationCancelled"
 
     EXPIRES_AFTER = timedelta(days=1)
+    EXPIRES_AFTER_SECONDS = EXPIRES_AFTER.total_seconds()
+
+    # A (started_at, seconds since the epoch) pair, so .active can compare against time.time().
+    _started_epoch = None
 
     ##### Public Interface / Magic Methods ###################################  # noqa: E266
 
@@ -1603,7 +1661,9 @@ class Validation(Base):
         This does not send out a validation email -- that needs to be handled separately by something
         capable of generating the URL to the validation controller.
         """
-        self.started_at = datetime.utcnow()
+        now = time.time()
+        self.started_at = datetime.utcfromtimestamp(now)
+        self._started_epoch = (self.started_at, now)
         self.secret = generate_secret()
         self.success = False
 
@@ -1650,6 +1710,14 @@ class Validation(Base):
             return None
         return self.started_at + self.EXPIRES_AFTER
 
+    @property
+    def started_epoch(self):
+        """The naive UTC started_at value as seconds since the epoch, computed once per started_at value."""
+        started_at = self.started_at
+        if self._started_epoch is None or self._started_epoch[0] is not started_at:
+            self._started_epoch = (started_at, started_at.replace(tzinfo=timezone.utc).timestamp())
+        return self._started_epoch[1]
+
     @property
     def active(self):
         """
@@ -1657,8 +1725,7 @@ class Validation(Base):
 
         An inactive Validation can't be marked as successful -- it needs to be reset.
         """
-        now = datetime.utcnow()
-        return not self.success and now < self.deadline
+        return not self.success and time.time() < self.started_epoch + self.EXPIRES_AFTER_SECONDS
 
     ##### Class Methods ######################################################  # noqa: E266
 
@@ -1916,6 +1983,27 @@ class ExternalIntegration(Base):
 
         return integrations[0]
 
+    @classmethod
+    def lookup_by_goal(cls, _db, goal):
+        """
+        Look up the integrations for every protocol with the given goal, in one query.
+
+        :return: A dict mapping each protocol to its integration. As with lookup(), if a protocol has
+            more than one integration for this goal, a warning is logged and the first one is used.
+        """
+        by_protocol = {}
+        duplicated = []
+        for integration in _db.query(cls).filter(cls.goal == goal):
+            if integration.protocol not in by_protocol:
+                by_protocol[integration.protocol] = integration
+            elif integration.protocol not in duplicated:
+                duplicated.append(integration.protocol)
+
+        for protocol in duplicated:
+            logging.warning("Multiple integrations found for '%s'/'%s'" % (protocol, goal))
+
+        return by_protocol
+
     ##### Private Class Methods ##############################################  # noqa: E266
 
 
@@ -1943,6 +2031,9 @@ class ConfigurationSetting(Base):
     MEANS_YES = set(['true', 't', 'yes', 'y'])
     SECRET_SETTING_KEYWORDS = set(['password', 'secret'])
 
+    # Key in Session.info under which sitewide() remembers the settings found in the current transaction.
+    SITEWIDE_CACHE_KEY = 'sitewide_configuration_settings'
+
     ##### Public Interface / Magic Methods ###################################  # noqa: E266
 
     def __repr__(self):
@@ -2131,8 +2222,27 @@ class ConfigurationSetting(Base):
 
     @classmethod
     def sitewide(cls, _db, key):
-        """Find or create a sitewide ConfigurationSetting."""
-        return cls.for_library_and_externalintegration(_db, key, None, None)
+        """
+        Find or create a sitewide ConfigurationSetting.
+
+        Settings are remembered until the session's current transaction ends, so code that checks
+        the same setting over and over (e.g. once per notification email) only looks it up once.
+        """
+        session = _db() if isinstance(_db, scoped_session) else _db     # The app's session is a scoped_session
+        transaction = session.transaction
+        if transaction is None:
+            return cls.for_library_and_externalintegration(_db, key, None, None)
+
+        (cached_for, found) = session.info.get(cls.SITEWIDE_CACHE_KEY, (None, None))
+        if cached_for is not transaction:
+            found = {}
+            session.info[cls.SITEWIDE_CACHE_KEY] = (transaction, found)
+
+        setting = found.get(key)
+        if setting is None or setting not in session or setting in session.deleted:
+            setting = found[key] = cls.for_library_and_externalintegration(_db, key, None, None)
+
+        return setting
 
     @classmethod
     def for_library(cls, key, library):
@@ -27,11 +27,10 @@ class GeometryUtility():
 
                 'SRID=4326;POINT({longitude} {latitude})'
         """
-        reader = geolite2.reader()  # TODO: Move this instantiation after None check
         if not ip_address:
             return None
 
-        match = reader.get(ip_address)
+        match = geolite2.reader().get(ip_address)
         if match is None:
             return None
 
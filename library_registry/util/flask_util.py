@@ -1,4 +1,5 @@
 """Utilities for Flask applications."""
+import functools
 import re
 import ipaddress
 
@@ -58,13 +59,24 @@ def is_public_ipv4_address(ip_string):
             pass             # TODO: Log it. Some caller is passing bad values to this fn.
             return None      # incoming value couldn't be coerced to an IPv4Address object
 
+    return _is_public_address(ip_string)
+
+
+@functools.lru_cache(maxsize=1024)
+def _is_public_address(address):
+    """
+    Whether a parsed ipaddress object is publicly routable, according to the ipaddress module's own network tables.
+
+    The same few addresses (proxies, repeat clients) come up over and over, and each of these properties scans its
+    own list of networks, so the answer is cached per address.
+    """
     return bool(
-        ip_string.is_private     is False and     # noqa: E272
-        ip_string.is_multicast   is False and     # noqa: E272
-        ip_string.is_unspecified is False and     # noqa: E272
-        ip_string.is_reserved    is False and     # noqa: E272
-        ip_string.is_loopback    is False and     # noqa: E272
-        ip_string.is_link_local  is False         # noqa: E272
+        address.is_private     is False and     # noqa: E272
+        address.is_multicast   is False and     # noqa: E272
+        address.is_unspecified is False and     # noqa: E272
+        address.is_reserved    is False and     # noqa: E272
+        address.is_loopback    is False and     # noqa: E272
+        address.is_link_local  is False         # noqa: E272
     )
 
 
@@ -89,6 +101,14 @@ def originating_ip():
     client_ip = None
 
     if forwarded_for:
+        # Usually the first entry is the public client address, so check it on its own before
+        # scanning the whole header.
+        (first, _, _) = str(forwarded_for).partition(',')
+        first = first.strip()
+        if ':' not in first and is_public_ipv4_address(first):
+            return first
+
+        fwd4_addresses = []
         try:
             fwd4_addresses = re.findall(IPV4_REGEX, forwarded_for)
         except TypeError:   # whatever's in the header isn't a string/bytes-like object
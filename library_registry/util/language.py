@@ -1,5 +1,5 @@
 import os
-from collections import defaultdict
+import sys
 
 from pkg_resources import resource_string
 
@@ -29,11 +29,16 @@ class LanguageCodes:
     http://www.loc.gov/standards/iso639-2/ISO-639-2_utf-8.txt
     """
     ##### Class Constants/Attributes #########################################  # noqa: E266
-    two_to_three            = defaultdict(lambda: None)     # noqa: E221
-    three_to_two            = defaultdict(lambda: None)     # noqa: E221
-    english_names           = defaultdict(list)             # noqa: E221
-    english_names_to_three  = defaultdict(lambda: None)     # noqa: E221
-    native_names            = defaultdict(list)             # noqa: E221
+    # These tables are filled in once, below, and only read after that. They're plain dicts
+    # rather than defaultdicts so that looking up an unknown code doesn't add an entry for it.
+    two_to_three            = {}    # noqa: E221
+    three_to_two            = {}    # noqa: E221
+    english_names           = {}    # noqa: E221
+    english_names_to_three  = {}    # noqa: E221
+    codes_to_three          = {}    # noqa: E221
+    native_names            = {}    # noqa: E221
+
+    NO_NAMES = ()
 
     RAW_DATA = resource_string('library_registry', 'data/ISO-639-2_utf-8.txt').decode('utf-8')
 
@@ -54,15 +59,23 @@ class LanguageCodes:
 
     for i in RAW_DATA.split("\n"):
         (alpha_3, terminologic_code, alpha_2, names, french_names) = i.strip().split("|")
-        names = [x.strip() for x in names.split(";")]
+        names = tuple(x.strip() for x in names.split(";"))
+
+        # Intern the codes, so every table (and every caller) shares one string object per code.
+        alpha_3 = sys.intern(alpha_3)
+        alpha_2 = sys.intern(alpha_2)
 
         if alpha_2:
             three_to_two[alpha_3] = alpha_2
             english_names[alpha_2] = names
             two_to_three[alpha_2] = alpha_3
 
+            # Both codes of a language with an alpha-2 code resolve to its alpha-3 code.
+            codes_to_three[alpha_3] = alpha_3
+            codes_to_three[alpha_2] = alpha_3
+
         for name in names:
-            english_names_to_three[name.lower()] = alpha_3
+            english_names_to_three[name.casefold()] = alpha_3
 
         english_names[alpha_3] = names
 
@@ -70,7 +83,7 @@ class LanguageCodes:
         alpha_2 = i['code']
         alpha_3 = two_to_three[alpha_2]
         names = i['nativeName']
-        names = [x.strip() for x in names.split(",")]
+        names = tuple(x.strip() for x in names.split(","))
         native_names[alpha_2] = names
         native_names[alpha_3] = names
 
@@ -81,6 +94,16 @@ class LanguageCodes:
     ##### Properties and Getters/Setters #####################################  # noqa: E266
 
     ##### Class Methods ######################################################  # noqa: E266
+    @classmethod
+    def english_names_for(cls, code):
+        """Return the English names of the language with the given alpha-2 or alpha-3 code."""
+        return cls.english_names.get(code, cls.NO_NAMES)
+
+    @classmethod
+    def native_names_for(cls, code):
+        """Return the native names of the language with the given alpha-2 or alpha-3 code."""
+        return cls.native_names.get(code, cls.NO_NAMES)
+
     @classmethod
     def iso_639_2_for_locale(cls, locale):
         """Turn a locale code into an ISO-639-2 alpha-3 language code."""
@@ -89,54 +112,40 @@ class LanguageCodes:
         else:
             language = locale
 
-        if cls.two_to_three[language]:
-            return cls.two_to_three[language]
-        elif cls.three_to_two[language]:    # It's already ISO-639-2.
-            return language
-
-        return None
+        # Either an alpha-2 code to convert, or an alpha-3 code that's already ISO-639-2. Both
+        # come back as the table's own interned alpha-3 string.
+        return cls.codes_to_three.get(language)
 
     @classmethod
     def string_to_alpha_3(cls, s):
         """Try really hard to convert a string to an ISO-639-2 alpha-3 language code."""
         if not s:
             return None
-        s = s.lower()
+        s = s.casefold()
         if s in cls.english_names_to_three:  # It's the English name of a language.
             return cls.english_names_to_three[s]
 
-        if "-" in s:
-            s = s.split("-")[0]
-
-        if s in cls.three_to_two:       # It's already an alpha-3.
-            return s
-        elif s in cls.two_to_three:     # It's an alpha-2.
-            return cls.two_to_three[s]
-
-        return None
+        # It may be an alpha-3 or alpha-2 code, possibly with a region attached, as in "en-GB".
+        return cls.codes_to_three.get(s.partition("-")[0])
 
     @classmethod
     def name_for_languageset(cls, languages):
+        """Describe a set of languages as a '/'-separated list of names, preferring each one's native name."""
         if isinstance(languages, str):
             languages = languages.split(",")
 
-        all_names = []
-
         if not languages:
             return ""
 
-        for lang in languages:
-            normalized = cls.string_to_alpha_3(lang)
-            native_names = cls.native_names.get(normalized, [])
-            if native_names:
-                all_names.append(native_names[0])
-            else:
-                names = cls.english_names.get(normalized, [])
-                if not names:
-                    raise ValueError("No native or English name for %s" % lang)
-                all_names.append(names[0])
-
-        if len(all_names) == 1:
-            return all_names[0]
-
-        return "/".join(all_names)
+        to_alpha_3 = cls.string_to_alpha_3
+        native_names = cls.native_names
+        english_names = cls.english_names
+
+        def name_for(lang):
+            normalized = to_alpha_3(lang)
+            names = native_names.get(normalized) or english_names.get(normalized)
+            if not names:
+                raise ValueError("No native or English name for %s" % lang)
+            return names[0]
+
+        return "/".join(name_for(lang) for lang in languages)
@@ -1,10 +1,11 @@
+import functools
 import os
 import random
 import uuid
 from pathlib import Path
 
 import pytest
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect
 from sqlalchemy.exc import ProgrammingError
 from sqlalchemy.orm.session import Session
 
@@ -36,6 +37,12 @@ TEST_DATA_DIR = Path(os.path.dirname(__file__)) / "data"
 test_db_url = Configuration.database_url(test=True)
 
 
+@functools.lru_cache(maxsize=None)
+def read_test_geojson(filename):
+    """The contents of a GeoJSON file in the test data directory, read from disk once per test run"""
+    return (TEST_DATA_DIR / filename).read_text()
+
+
 def pytest_configure(config):
     """Add configuration options to Pytest"""
     # Register custom markers
@@ -47,10 +54,46 @@ def pytest_configure(config):
     )
 
 
+def worker_schema():
+    """
+    Name of the schema the current pytest-xdist worker should run in, or None outside of xdist.
+
+    Each worker gets its own schema in the test database, so parallel workers never contend
+    for the same rows, unique constraints, or index builds.
+    """
+    worker_id = os.environ.get("PYTEST_XDIST_WORKER")
+    return f"test_{worker_id}" if worker_id else None
+
+
+def create_test_engine():
+    """
+    Create an engine for the test database, scoped to this worker's schema if there is one.
+
+    Every table and enum type is created in and queried from the worker's schema by name. The search_path alone
+    isn't enough: once a serial run has left tables in public, create_all() would find those and create nothing,
+    and every worker would end up sharing them. public stays on the search_path for the PostGIS and fuzzystrmatch
+    functions installed there.
+    """
+    schema = worker_schema()
+    if not schema:
+        return create_engine(test_db_url)
+
+    return create_engine(
+        test_db_url,
+        connect_args={"options": f"-csearch_path={schema},public"},
+        execution_options={"schema_translate_map": {None: schema}},
+    )
+
+
 @pytest.fixture(autouse=True, scope="session")
 def init_test_db():
     """For a given testing session, pave and re-initialize the database"""
-    engine = create_engine(test_db_url)
+    engine = create_test_engine()
+
+    schema = worker_schema()
+    if schema:
+        with engine.begin() as conn:
+            conn.execute(f"CREATE SCHEMA IF NOT EXISTS {schema}")
 
     for table in reversed(Base.metadata.sorted_tables):
         try:
@@ -61,24 +104,99 @@ def init_test_db():
     with engine.connect() as conn:
         Base.metadata.create_all(conn)
 
+    if schema:
+        missing = set(Base.metadata.tables) - set(inspect(engine).get_table_names(schema=schema))
+        assert not missing, f"Tables missing from schema {schema}: {sorted(missing)}"
+
     engine.dispose()
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def db_engine():
-    engine = create_engine(test_db_url)
+    engine = create_test_engine()
     yield engine
     engine.dispose()
 
 
 @pytest.fixture
 def db_session(db_engine):
+    """
+    A Session joined to an outer transaction that is rolled back after the test, so the schema
+    is only created once per test run and no test sees another's rows.
+
+    The session itself works inside a SAVEPOINT, which is restarted whenever it ends. That lets
+    the test and the code under test call commit() or rollback() without touching the outer
+    transaction.
+    """
     with db_engine.connect() as connection:
-        transaction = connection.begin_nested()
-        session = Session(connection)
+        transaction = connection.begin()
+        session = Session(bind=connection)
+        session.begin_nested()
+
+        @event.listens_for(session, "after_transaction_end")
+        def restart_savepoint(sess, trans):
+            if trans.nested and not trans._parent.nested:
+                sess.expire_all()
+                sess.begin_nested()
+
         yield session
-        transaction.rollback()
         session.close()
+        transaction.rollback()
+
+
+@pytest.fixture
+def query_counter(db_session):
+    """
+    Record every SQL statement sent through db_session's connection, so a test can set an
+    explicit query budget for the code it exercises.
+
+    Usage:
+
+        def test_something(db_session, query_counter):
+            db_session.flush()      # Keep pending test setup out of the count
+            query_counter.clear()
+            do_something(db_session)
+            assert len(query_counter) <= 2, query_counter
+    """
+    statements = []
+    connection = db_session.get_bind()
+
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(connection, "before_cursor_execute", _record)
+    yield statements
+    event.remove(connection, "before_cursor_execute", _record)
+
+
+@pytest.fixture
+def set_library_stages(db_session):
+    """
+    Move a group of libraries to new stages with a single UPDATE, instead of one UPDATE per library.
+
+    This writes the columns directly, so it skips the Library.library_stage setter's check on leaving
+    production. Tests of that check should go through the setter.
+
+    Usage:
+
+        set_library_stages([nypl, boston], registry_stage=Library.TESTING_STAGE)
+    """
+    def _set_library_stages(libraries, registry_stage=None, library_stage=None):
+        values = {}
+        if registry_stage:
+            values[Library.registry_stage] = registry_stage
+        if library_stage:
+            values[Library._library_stage] = library_stage
+
+        db_session.flush()
+        # Read ids from the identity map, since commits in the fixtures may have expired these instances.
+        library_ids = [inspect(library).identity[0] for library in libraries]
+        db_session.query(Library).filter(Library.id.in_(library_ids)).update(values, synchronize_session=False)
+
+        for library in libraries:
+            db_session.expire(library, ["registry_stage", "_library_stage"])
+
+    return _set_library_stages
 
 
 @pytest.fixture
@@ -141,29 +259,43 @@ def create_test_library():
             "library_stage": library_stage,
             "registry_stage": registry_stage,
         }
-        (library, _) = get_one_or_create(db_session, Library, name=library_name, create_method_kwargs=create_kwargs)
+        (library, is_new) = get_one_or_create(
+            db_session, Library, name=library_name, create_method_kwargs=create_kwargs
+        )
+
+        def add_service_area(place, area_type):
+            if is_new:
+                # A library that was just created has no service areas to look up, so add this one and let
+                # the commit below insert them all in one batch.
+                db_session.add(ServiceArea(library=library, place=place, type=area_type))
+            else:
+                get_one_or_create(db_session, ServiceArea, library=library, place=place, type=area_type)
 
         if eligibility_areas and isinstance(eligibility_areas, list):
-            for place in eligibility_areas:
+            for place in dict.fromkeys(eligibility_areas):
                 if not isinstance(place, Place):
                     # TODO: Emit a warning
                     continue
-                get_one_or_create(db_session, ServiceArea, library=library, place=place, type=ServiceArea.ELIGIBILITY)
+                add_service_area(place, ServiceArea.ELIGIBILITY)
 
         if focus_areas and isinstance(focus_areas, list):
-            for place in focus_areas:
+            for place in dict.fromkeys(focus_areas):
                 if not isinstance(place, Place):
                     # TODO: Emit a warning
                     continue
-                get_one_or_create(db_session, ServiceArea, library=library, place=place, type=ServiceArea.FOCUS)
+                add_service_area(place, ServiceArea.FOCUS)
 
         audiences = audiences or [Audience.PUBLIC]
         library.audiences = [Audience.lookup(db_session, audience) for audience in audiences]
 
         if has_email:
-            library.set_hyperlink(Hyperlink.INTEGRATION_CONTACT_REL, f"mailto:{library_name}@library.org")
-            library.set_hyperlink(Hyperlink.HELP_REL, f"mailto:{library_name}@library.org")
-            library.set_hyperlink(Hyperlink.COPYRIGHT_DESIGNATED_AGENT_REL, f"mailto:{library_name}@library.org")
+            # All three links share one Resource. Attaching it directly, rather than going through
+            # set_hyperlink() once per rel, lets the commit below insert the links in one batch.
+            (email, _) = get_one_or_create(db_session, Resource, href=f"mailto:{library_name}@library.org")
+            for rel in (Hyperlink.INTEGRATION_CONTACT_REL, Hyperlink.HELP_REL,
+                        Hyperlink.COPYRIGHT_DESIGNATED_AGENT_REL):
+                link = Library.get_hyperlink(library, rel) or Hyperlink(library=library, rel=rel)
+                link.resource = email
 
         db_session.commit()
 
@@ -211,9 +343,12 @@ def create_test_place():
             "type": place_type,
             "abbreviated_name": abbreviated_name,
             "parent": parent,
-            "geometry": geometry,
         }
-        (place, _) = get_one_or_create(db_session, Place, **create_kwargs)
+        # The geometry is only needed if the place has to be created. Leaving it out of the lookup
+        # keeps large GeoJSON shapes out of the SELECT, and spares PostGIS a geometry comparison.
+        (place, _) = get_one_or_create(
+            db_session, Place, create_method_kwargs={"geometry": geometry}, **create_kwargs
+        )
         db_session.commit()
         return place
 
@@ -370,12 +505,10 @@ def crude_us(db_session, create_test_place):
     """
     place = create_test_place(
         db_session, external_id="US", external_name="United States", place_type=Place.NATION,
-        abbreviated_name="US", parent=None, geometry=(TEST_DATA_DIR / 'crude_us_geojson.json').read_text()
+        abbreviated_name="US", parent=None, geometry=read_test_geojson('crude_us_geojson.json')
     )
     db_session.commit()
     yield place
-    db_session.delete(place)
-    db_session.commit()
 
 
 @pytest.fixture
@@ -383,12 +516,10 @@ def new_york_state(db_session, create_test_place, crude_us):
     place = create_test_place(
         db_session, external_id="36", external_name="New York", place_type=Place.STATE,
         abbreviated_name="NY", parent=crude_us,
-        geometry=(TEST_DATA_DIR / 'ny_state_geojson.json').read_text()
+        geometry=read_test_geojson('ny_state_geojson.json')
     )
     db_session.commit()
     yield place
-    db_session.delete(place)
-    db_session.commit()
 
 
 @pytest.fixture
@@ -396,12 +527,10 @@ def connecticut_state(db_session, create_test_place, crude_us):
     place = create_test_place(
         db_session, external_id="09", external_name="Connecticut", place_type=Place.STATE,
         abbreviated_name="CT", parent=crude_us,
-        geometry=(TEST_DATA_DIR / 'ct_state_geojson.json').read_text()
+        geometry=read_test_geojson('ct_state_geojson.json')
     )
     db_session.commit()
     yield place
-    db_session.delete(place)
-    db_session.commit()
 
 
 @pytest.fixture
@@ -409,12 +538,10 @@ def kansas_state(db_session, create_test_place, crude_us):
     place = create_test_place(
         db_session, external_id="20", external_name="Kansas", place_type=Place.STATE,
         abbreviated_name="KS", parent=crude_us,
-        geometry=(TEST_DATA_DIR / 'kansas_state_geojson.json').read_text()
+        geometry=read_test_geojson('kansas_state_geojson.json')
     )
     db_session.commit()
     yield place
-    db_session.delete(place)
-    db_session.commit()
 
 
 @pytest.fixture
@@ -425,8 +552,6 @@ def massachusetts_state(db_session, create_test_place, crude_us):
     )
     db_session.commit()
     yield place
-    db_session.delete(place)
-    db_session.commit()
 
 
 @pytest.fixture
@@ -434,12 +559,10 @@ def new_mexico_state(db_session, create_test_place, crude_us):
     place = create_test_place(
         db_session, external_id="NM", external_name="New Mexico", place_type=Place.STATE,
         abbreviated_name="NM", parent=crude_us,
-        geometry=(TEST_DATA_DIR / 'new_mexico_state_geojson.json').read_text()
+        geometry=read_test_geojson('new_mexico_state_geojson.json')
     )
     db_session.commit()
     yield place
-    db_session.delete(place)
-    db_session.commit()
 
 
 @pytest.fixture
@@ -447,15 +570,13 @@ def new_york_city(db_session, create_test_place, new_york_state):
     place = create_test_place(
         db_session, external_id="365100", external_name="New York", place_type=Place.CITY,
         abbreviated_name=None, parent=new_york_state,
-        geometry=(TEST_DATA_DIR / 'ny_city_geojson.json').read_text()
+        geometry=read_test_geojson('ny_city_geojson.json')
     )
     for place_alias in ["Manhattan", "Brooklyn", "New York"]:
         get_one_or_create(db_session, PlaceAlias, place=place, name=place_alias)
 
     db_session.commit()
     yield place
-    db_session.delete(place)
-    db_session.commit()
 
 
 @pytest.fixture
@@ -468,12 +589,10 @@ def crude_kings_county(db_session, create_test_place, new_york_state):
     place = create_test_place(
         db_session, external_id="Kings", external_name="Kings", place_type=Place.COUNTY,
         abbreviated_name=None, parent=new_york_state,
-        geometry=(TEST_DATA_DIR / 'crude_kings_county_geojson.json').read_text()
+        geometry=read_test_geojson('crude_kings_county_geojson.json')
     )
     db_session.commit()
     yield place
-    db_session.delete(place)
-    db_session.commit()
 
 
 @pytest.fixture
@@ -485,8 +604,6 @@ def lake_placid_ny(db_session, create_test_place, new_york_state):
     )
     db_session.commit()
     yield place
-    db_session.delete(place)
-    db_session.commit()
 
 
 @pytest.fixture
@@ -494,12 +611,10 @@ def crude_new_york_county(db_session, create_test_place, new_york_state):
     place = create_test_place(
         db_session, external_id="Manhattan", external_name="New York County", place_type=Place.COUNTY,
         abbreviated_name="NY", parent=new_york_state,
-        geometry=(TEST_DATA_DIR / 'crude_new_york_county_geojson.json').read_text()
+        geometry=read_test_geojson('crude_new_york_county_geojson.json')
     )
     db_session.commit()
     yield place
-    db_session.delete(place)
-    db_session.commit()
 
 
 @pytest.fixture
@@ -508,12 +623,10 @@ def zip_10018(db_session, create_test_place, new_york_state):
     place = create_test_place(
         db_session, external_id="10018", external_name="10018", place_type=Place.POSTAL_CODE,
         abbreviated_name=None, parent=new_york_state,
-        geometry=(TEST_DATA_DIR / 'zip_10018_geojson.json').read_text()
+        geometry=read_test_geojson('zip_10018_geojson.json')
     )
     db_session.commit()
     yield place
-    db_session.delete(place)
-    db_session.commit()
 
 
 @pytest.fixture
@@ -522,13 +635,11 @@ def zip_11212(db_session, create_test_place, new_york_state):
     place = create_test_place(
         db_session, external_id="11212", external_name="11212", place_type=Place.POSTAL_CODE,
         abbreviated_name=None, parent=new_york_state,
-        geometry=(TEST_DATA_DIR / 'zip_11212_geojson.json').read_text()
+        geometry=read_test_geojson('zip_11212_geojson.json')
     )
     get_one_or_create(db_session, PlaceAlias, place=place, name="Brooklyn")
     db_session.commit()
     yield place
-    db_session.delete(place)
-    db_session.commit()
 
 
 @pytest.fixture
@@ -537,12 +648,10 @@ def zip_12601(db_session, create_test_place, new_york_state):
     place = create_test_place(
         db_session, external_id="12601", external_name="12601", place_type=Place.POSTAL_CODE,
         abbreviated_name=None, parent=new_york_state,
-        geometry=(TEST_DATA_DIR / 'zip_12601_geojson.json').read_text()
+        geometry=read_test_geojson('zip_12601_geojson.json')
     )
     db_session.commit()
     yield place
-    db_session.delete(place)
-    db_session.commit()
 
 
 @pytest.fixture
@@ -551,12 +660,10 @@ def crude_albany(db_session, create_test_place, new_york_state):
     place = create_test_place(
         db_session, external_id="Albany", external_name="Albany", place_type=Place.CITY,
         abbreviated_name=None, parent=new_york_state,
-        geometry=(TEST_DATA_DIR / 'crude_albany_geojson.json').read_text()
+        geometry=read_test_geojson('crude_albany_geojson.json')
     )
     db_session.commit()
     yield place
-    db_session.delete(place)
-    db_session.commit()
 
 
 @pytest.fixture
@@ -565,12 +672,10 @@ def boston_ma(db_session, create_test_place, massachusetts_state):
     place = create_test_place(
         db_session, external_id="2507000", external_name="Boston", place_type=Place.CITY,
         abbreviated_name=None, parent=massachusetts_state,
-        geometry=(TEST_DATA_DIR / 'boston_geojson.json').read_text()
+        geometry=read_test_geojson('boston_geojson.json')
     )
     db_session.commit()
     yield place
-    db_session.delete(place)
-    db_session.commit()
 
 
 @pytest.fixture
@@ -579,12 +684,10 @@ def manhattan_ks(db_session, create_test_place, kansas_state):
     place = create_test_place(
         db_session, external_id="2044250", external_name="Manhattan", place_type=Place.CITY,
         abbreviated_name=None, parent=kansas_state,
-        geometry=(TEST_DATA_DIR / 'manhattan_ks_geojson.json').read_text()
+        geometry=read_test_geojson('manhattan_ks_geojson.json')
     )
     db_session.commit()
     yield place
-    db_session.delete(place)
-    db_session.commit()
 
 
 @pytest.fixture
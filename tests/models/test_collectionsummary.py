@@ -26,6 +26,22 @@ class TestCollectionSummaryModel:
             db_session.delete(db_item)
         db_session.commit()
 
+    def test_set_updates_existing_summary(self, db_session, create_test_library, query_counter):
+        """
+        GIVEN: A Library with a CollectionSummary for a given language
+        WHEN:  CollectionSummary.set() is called again for that library and language
+        THEN:  The existing CollectionSummary should be updated in place, without querying for it
+        """
+        library = create_test_library(db_session)
+        summary = CollectionSummary.set(library, "eng", 100)
+        assert library.collections == [summary]
+
+        query_counter.clear()
+        assert CollectionSummary.set(library, "eng", "0") is summary
+        assert summary.size == 0
+        assert library.collections == [summary]
+        assert query_counter == []
+
     def test_set_unknown_language_set_to_none(self, db_session, create_test_library):
         """
         GIVEN: A Library instance
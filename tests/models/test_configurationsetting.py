@@ -439,6 +439,30 @@ class TestConfigurationSettingModel:
         db_session.delete(created_setting)
         db_session.commit()
 
+    def test_sitewide_remembered_for_transaction(self, db_session, query_counter):
+        """
+        GIVEN: A sitewide ConfigurationSetting that has already been looked up
+        WHEN:  ConfigurationSetting.sitewide() is called on that key again
+        THEN:  The same object should be returned without querying the database, until the
+               transaction ends or the setting is deleted
+        """
+        keyname = "test_sitewide_remembered"
+        setting = ConfigurationSetting.sitewide(db_session, keyname)
+        db_session.flush()
+        query_counter.clear()
+
+        assert ConfigurationSetting.sitewide(db_session, keyname) is setting
+        assert query_counter == []
+
+        db_session.commit()
+        assert ConfigurationSetting.sitewide(db_session, keyname) is setting
+        assert query_counter != []
+
+        db_session.delete(setting)
+        replacement = ConfigurationSetting.sitewide(db_session, keyname)
+        assert replacement is not setting
+        assert replacement.key == keyname
+
     def test_sitewide_secret(self, db_session, monkeypatch):
         """
         GIVEN: A key name
@@ -130,3 +130,30 @@ class TestExternalIntegrationModel:
         db_session.delete(integration_one)
         db_session.delete(integration_two)
         db_session.commit()
+
+    def test_lookup_by_goal(self, db_session, create_test_external_integration, caplog):
+        """
+        GIVEN: Several ExternalIntegrations for a goal, two of which share a protocol
+        WHEN:  ExternalIntegration.lookup_by_goal() is called for that goal
+        THEN:  The first integration for each protocol should be returned, keyed by protocol, and a
+               single warning logged for the duplicated protocol
+        """
+        goal = ExternalIntegration.LOGGING_GOAL
+        assert ExternalIntegration.lookup_by_goal(db_session, goal) == {}
+
+        first = create_test_external_integration(db_session, protocol="alpha", goal=goal)
+        duplicates = [create_test_external_integration(db_session, protocol="alpha", goal=goal) for _ in range(2)]
+        other = create_test_external_integration(db_session, protocol="bravo", goal=goal)
+        elsewhere = create_test_external_integration(db_session, protocol="charlie", goal="some other goal")
+
+        by_protocol = ExternalIntegration.lookup_by_goal(db_session, goal)
+        assert set(by_protocol) == {"alpha", "bravo"}
+        assert by_protocol["alpha"].id == first.id
+        assert by_protocol["bravo"].id == other.id
+
+        warnings = [x for x in caplog.messages if x.startswith("Multiple integrations found")]
+        assert warnings == [f"Multiple integrations found for 'alpha'/'{goal}'"]
+
+        for integration in [first, *duplicates, other, elsewhere]:
+            db_session.delete(integration)
+        db_session.commit()
@@ -1,8 +1,11 @@
 import random
 import re
 import uuid
+from datetime import datetime
 
 import pytest
+from sqlalchemy import inspect
+from sqlalchemy.orm import selectinload
 
 from library_registry.constants import LibraryType
 from library_registry.model import (
@@ -11,6 +14,7 @@ from library_registry.model import (
     Library,
     LibraryAlias,
     Place,
+    ServiceArea,
 )
 from library_registry.model_helpers import get_one_or_create
 from library_registry.util import GeometryUtility
@@ -18,6 +22,10 @@ from library_registry.util import GeometryUtility
 
 GENERATED_SHORT_NAME_REGEX = re.compile(r'^[A-Z]{6}$')
 
+# Points to search from, shared by the search tests.
+CALIFORNIA = GeometryUtility.point(35, -118)
+MAINE = GeometryUtility.point(43, -70)
+
 
 class TestLibraryModel:
     ##### Public Method Tests ################################################  # noqa: E266
@@ -62,7 +70,7 @@ class TestLibraryModel:
         (link_original, _) = library.set_hyperlink("rel", "href1", "href2")
         # Calling set_hyperlink again does not modify the link so long as the old href is still a possibility.
         (link_new, is_modified) = library.set_hyperlink("rel", "href2", "href1")
-        assert link_original == link_new
+        assert link_original is link_new
         assert link_new.rel == "rel"
         assert link_new.href == "href1"
         assert is_modified is False
@@ -77,10 +85,50 @@ class TestLibraryModel:
         (link_original, _) = library.set_hyperlink("rel", "href1", "href2")
         (link_modified, is_modified) = library.set_hyperlink("rel", "href2", "href3")
         assert is_modified is True
-        assert link_original == link_modified
+        assert link_original is link_modified
         assert link_modified.rel == "rel"
         assert link_modified.href == "href2"
 
+    def test_set_hyperlink_loaded_hyperlinks(self, db_session, create_test_library, query_counter):
+        """
+        GIVEN: An existing Library object whose hyperlinks collection is already loaded
+        WHEN:  .set_hyperlink() is called for a rel the Library already has a link for
+        THEN:  The existing Hyperlink is found in the loaded collection, without querying for it
+        """
+        library = create_test_library(db_session)
+        library.set_hyperlink("rel", "href1")
+        db_session.flush()
+        assert [x.rel for x in library.hyperlinks] == ["rel"]
+        query_counter.clear()
+
+        (link, is_modified) = library.set_hyperlink("rel", "href2", "href1")
+        assert is_modified is False
+        assert link.href == "href1"
+
+        (link, is_modified) = library.set_hyperlink("rel", "href3")
+        assert is_modified is True
+        assert link.href == "href3"
+        assert not [x for x in query_counter if "FROM hyperlinks" in x]
+
+    def test_set_hyperlink_unloaded_hyperlinks(self, db_session, create_test_library, query_counter):
+        """
+        GIVEN: An existing Library object whose hyperlinks collection has not been loaded
+        WHEN:  .set_hyperlink() is called for a rel the Library already has a link for
+        THEN:  Only that rel's Hyperlink is queried, and the collection is left unloaded
+        """
+        library = create_test_library(db_session)
+        library.set_hyperlink("rel", "href1")
+        library.set_hyperlink("other_rel", "href2")
+        db_session.flush()
+        db_session.expire(library, ["hyperlinks"])
+        query_counter.clear()
+
+        (link, is_modified) = library.set_hyperlink("rel", "href2", "href1")
+        assert is_modified is False
+        assert (link.rel, link.href) == ("rel", "href1")
+        assert len([x for x in query_counter if "FROM hyperlinks" in x]) == 1
+        assert "hyperlinks" in inspect(library).unloaded
+
     def test_set_hyperlink_one_link_rel_per_library(self, db_session, create_test_library):
         """
         GIVEN: An existing Library object with a hyperlink for a specific rel name
@@ -149,6 +197,24 @@ class TestLibraryModel:
             nypl.short_name = "ab|cd"
         assert "Short name cannot contain the pipe character" in str(exc.value)
 
+    @pytest.mark.parametrize(
+        "input,output",
+        [
+            pytest.param("abcd", "ABCD", id="lowercase"),
+            pytest.param("AbCd", "ABCD", id="mixed_case"),
+            pytest.param("ABCD", "ABCD", id="uppercase"),
+            pytest.param("ab12", "AB12", id="with_digits"),
+        ]
+    )
+    def test_short_name_normalized_on_write(self, nypl, input, output):
+        """
+        GIVEN: An existing Library object
+        WHEN:  The .short_name field of that object is set
+        THEN:  The value is stored uppercased, and is read back in that form
+        """
+        nypl.short_name = input
+        assert nypl.short_name == output
+
     ##### Property Method Tests ##############################################  # noqa: E266
 
     def test_set_library_stage(self, nypl):
@@ -195,6 +261,45 @@ class TestLibraryModel:
         nypl.registry_stage = Library.PRODUCTION_STAGE
         assert nypl.in_production is False
 
+    def test_in_production_expression(self, db_session, create_test_library):
+        """
+        GIVEN: Libraries in every combination of production and testing stages
+        WHEN:  Library.in_production is used to filter a Library query
+        THEN:  Only the Library that both the library and the registry consider in production should be returned,
+               in agreement with the instance property
+        """
+        stages = (Library.PRODUCTION_STAGE, Library.TESTING_STAGE)
+        libraries = [
+            create_test_library(db_session, library_stage=library_stage, registry_stage=registry_stage)
+            for library_stage in stages for registry_stage in stages
+        ]
+        ids = [library.id for library in libraries]
+
+        found = db_session.query(Library).filter(
+            Library.id.in_(ids), Library.in_production
+        ).order_by(Library.id).all()
+
+        assert found == [library for library in libraries if library.in_production]
+        assert found == [libraries[0]]
+
+    def test_timestamp(self, db_session, create_test_library):
+        """
+        GIVEN: An existing Library whose timestamp is in the past
+        WHEN:  One of its columns is changed and the session is flushed
+        THEN:  The Library's .timestamp should be moved forward, without needing a commit
+        """
+        library = create_test_library(db_session)
+        assert library.timestamp is not None
+
+        long_ago = datetime(2000, 1, 1)
+        library.timestamp = long_ago
+        db_session.flush()
+        assert library.timestamp == long_ago
+
+        library.opds_url = "http://library.org/opds"
+        db_session.flush()
+        assert library.timestamp > long_ago
+
     def test_number_of_patrons(self, db_session, create_test_library):
         """
         GIVEN: A newly created Library in Production stage
@@ -209,6 +314,14 @@ class TestLibraryModel:
         )
         assert library.number_of_patrons == 1
 
+        # Another library's patrons aren't counted.
+        other_library = create_test_library(db_session)
+        DelegatedPatronIdentifier.get_one_or_create(
+            db_session, other_library, str(uuid.uuid4()), DelegatedPatronIdentifier.ADOBE_ACCOUNT_ID, None
+        )
+        assert library.number_of_patrons == 1
+        assert other_library.number_of_patrons == 1
+
     def test_number_of_patrons_non_adobe(self, db_session, create_test_library):
         """
         GIVEN: A newly created Library in Production stage
@@ -236,6 +349,29 @@ class TestLibraryModel:
         )
         assert library.number_of_patrons == 0
 
+    def test_number_of_patrons_expression(self, db_session, create_test_library):
+        """
+        GIVEN: A production Library and a testing Library, each with one Adobe Account ID
+        WHEN:  Library.number_of_patrons is used as a column in a query
+        THEN:  Each Library's count should come back from a single SELECT, and agree with the instance property
+        """
+        production = create_test_library(db_session)
+        testing = create_test_library(db_session, library_stage=Library.TESTING_STAGE)
+        for library in (production, testing):
+            DelegatedPatronIdentifier.get_one_or_create(
+                db_session, library, str(uuid.uuid4()), DelegatedPatronIdentifier.ADOBE_ACCOUNT_ID, None
+            )
+
+        counts = dict(
+            db_session.query(Library.id, Library.number_of_patrons).filter(
+                Library.id.in_([production.id, testing.id])
+            )
+        )
+
+        assert counts == {production.id: 1, testing.id: 0}
+        assert counts[production.id] == production.number_of_patrons
+        assert counts[testing.id] == testing.number_of_patrons
+
     def test_service_area_single(self, db_session, create_test_library, create_test_place):
         """
         GIVEN: An existing Place object
@@ -351,41 +487,52 @@ class TestLibraryModel:
         """
         assert Library.for_urn(db_session, nypl.internal_urn) == nypl
 
-    def test_random_short_name(self):
+    @pytest.fixture
+    def scripted_short_names(self, monkeypatch):
+        """
+        Make random.choices() produce the given six-letter names, in order, so the tests don't
+        depend on the random number generator's output for any particular seed.
         """
-        GIVEN: A pre-determined seed for the Python random library
+        def _script(*names):
+            letters = iter([list(name) for name in names])
+            monkeypatch.setattr(random, "choices", lambda population, k: next(letters))
+
+        return _script
+
+    def test_random_short_name(self, scripted_short_names):
+        """
+        GIVEN: The random number generator
         WHEN:  The Library.random_short_name() class method is called
-        THEN:  A seed-determined value or values are generated which are six ascii uppercase characters
+        THEN:  A value is generated which is six ascii uppercase characters, built from
+               one draw of six random letters
         """
-        random.seed(42)
-        SEED_42_FIRST_VALUE = "UDAXIH"
-        generated_name = Library.random_short_name()
-        assert generated_name == SEED_42_FIRST_VALUE
-        assert re.match
+        assert re.fullmatch("[A-Z]{6}", Library.random_short_name())
+
+        scripted_short_names("UDAXIH")
+        assert Library.random_short_name() == "UDAXIH"
 
-    def test_random_short_name_duplicate_check(self):
+    def test_random_short_name_duplicate_check(self, scripted_short_names):
         """
-        GIVEN: A duplicate check function indicating a seeded name is already in use
+        GIVEN: A duplicate check function indicating the first generated name is already in use
         WHEN:  The Library.random_short_name() function is called with that function
-        THEN:  The next seeded name value should be returned
+        THEN:  The next generated name should be returned
         """
-        random.seed(42)
-        SEED_42_FIRST_VALUE = "UDAXIH"
-        SEED_42_SECOND_VALUE = "HEXDVX"
-
-        assert Library.random_short_name() == SEED_42_FIRST_VALUE     # Call once to move past initial value
-        name = Library.random_short_name(duplicate_check=lambda x: x == SEED_42_FIRST_VALUE)
-        assert name == SEED_42_SECOND_VALUE
+        scripted_short_names("UDAXIH", "HEXDVX")
+        name = Library.random_short_name(duplicate_check=lambda x: x == "UDAXIH")
+        assert name == "HEXDVX"
 
     def test_random_short_name_quit_after_20_attempts(self):
         """
         GIVEN: A duplicate check function which always indicates a duplicate name exists
         WHEN:  Library.random_short_name() is called with that duplicate check
-        THEN:  A ValueError should be raised indicating no short name could be generated
+        THEN:  A ValueError should be raised indicating no short name could be generated,
+               after exactly 20 names have been checked
         """
+        checked = []
         with pytest.raises(ValueError) as exc:
-            Library.random_short_name(duplicate_check=lambda x: True)
+            Library.random_short_name(duplicate_check=lambda x: checked.append(x) or True)
         assert "Could not generate random short name after 20 attempts!" in str(exc.value)
+        assert len(checked) == 20
 
     def test_get_hyperlink(self, db_session, create_test_library):
         """
@@ -400,11 +547,11 @@ class TestLibraryModel:
 
         contact_link = Library.get_hyperlink(library, "contact_email")
         assert isinstance(contact_link, Hyperlink)
-        assert link1 == contact_link
+        assert link1 is contact_link
 
         help_link = Library.get_hyperlink(library, "help_email")
         assert isinstance(help_link, Hyperlink)
-        assert link2 == help_link
+        assert link2 is help_link
 
     def test_patron_counts_by_library(self, db_session, create_test_library):
         """
@@ -434,10 +581,23 @@ class TestLibraryModel:
             library_bravo.id: 3,
         }
 
+    def test_patron_counts_by_library_no_production_libraries(self, db_session, create_test_library, query_counter):
+        """
+        GIVEN: A Library that is not in production
+        WHEN:  Library.patron_counts_by_library() is passed a list containing only that Library
+        THEN:  An empty dictionary should be returned, without querying the database
+        """
+        library = create_test_library(db_session, library_stage=Library.TESTING_STAGE)
+        assert library.in_production is False
+
+        query_counter.clear()
+        assert Library.patron_counts_by_library(db_session, [library]) == {}
+        assert Library.patron_counts_by_library(db_session, []) == {}
+        assert query_counter == []
 
     @pytest.mark.needsdocstring
     def test_nearby(
-        self, db_session, nypl, connecticut_state_library
+        self, db_session, nypl, connecticut_state_library, set_library_stages
     ):
         """
         GIVEN:
@@ -481,8 +641,7 @@ class TestLibraryModel:
             return Library.nearby(db_session, (41.3, -73.3), production=production).count()
 
         # Take all the libraries we found earlier out of production.
-        for lib in (connecticut_state_library, nypl):
-            lib.registry_stage = Library.TESTING_STAGE
+        set_library_stages([connecticut_state_library, nypl], registry_stage=Library.TESTING_STAGE)
 
         # Now there are no results.
         assert m(True) == 0
@@ -490,64 +649,9 @@ class TestLibraryModel:
         # But we can run a search that includes libraries in the TESTING stage.
         assert m(False) == 2
 
-    @pytest.mark.needsdocstring
-    @pytest.mark.parametrize(
-        "input,output",
-        [
-            pytest.param("THE LIBRARY", "the library"),
-            pytest.param("\tthe   library\n\n", "the library"),
-            pytest.param("the libary", "the library"),
-        ]
-    )
-    def test_query_cleanup(self, input, output):
-        """
-        GIVEN:
-        WHEN:
-        THEN:
-        """
-        assert Library.query_cleanup(input) == output
-
-    @pytest.mark.needsdocstring
-    @pytest.mark.parametrize(
-        "input,output",
-        [
-            pytest.param("93203", "93203", id="us_zip"),
-            pytest.param("93203-1234", "93203", id="us_zip_plus_four"),
-            pytest.param("the library", None, id="non_postcode_string"),
-            pytest.param("AB1 0AA", None, id="uk_post_code"),
-        ]
-    )
-    def test_as_postal_code(self, input, output):
-        """
-        GIVEN:
-        WHEN:
-        THEN:
-        """
-        assert Library.as_postal_code(input) == output
-
-    @pytest.mark.needsdocstring
-    @pytest.mark.parametrize(
-        "input,output",
-        [
-            pytest.param("93203", (None, "93203", Place.POSTAL_CODE), id="us_zip"),
-            pytest.param("new york public library", ("new york public library", "new york", None), id="nypl"),
-            pytest.param("queens library", ("queens library", "queens", None), id="queens_library"),
-            pytest.param("kern county library", ("kern county library", "kern", Place.COUNTY), id="kern_county"),
-            pytest.param("new york state library", ("new york state library", "new york", Place.STATE), id="ny_state"),
-            pytest.param("lapl", ("lapl", "lapl", None), id="lapl"),
-        ]
-    )
-    def test_query_parts(self, input, output):
-        """
-        GIVEN:
-        WHEN:
-        THEN:
-        """
-        assert Library.query_parts(input) == output
-
     @pytest.mark.needsdocstring
     def test_search_by_library_name(
-        self, db_session, create_test_library, new_york_city, zip_11212, boston_ma
+        self, db_session, create_test_library, new_york_city, zip_11212, boston_ma, set_library_stages
     ):
         """
         GIVEN:
@@ -579,27 +683,26 @@ class TestLibraryModel:
         # Searching for part of the name--i.e. "boston" rather than "boston public library"--should work.
         assert search("boston") == [boston]
 
-        # Both libraries are known colloquially as 'BPL'.
-        for library in (brooklyn, boston):
-            get_one_or_create(db_session, LibraryAlias, name="BPL", language=None, library=library)
+        # Both libraries are known colloquially as 'BPL'. Neither has that alias yet, so add both and let the
+        # search's autoflush insert them together.
+        db_session.add_all([LibraryAlias(name="BPL", language=None, library=library) for library in (brooklyn, boston)])
 
-        assert set(search("bpl")) == set([brooklyn, boston])
+        assert set(search("bpl")) == {brooklyn, boston}
 
         # We do not tolerate typos in short names, because the chance of ambiguity is so high.
         assert search("opl") == []
 
         # If we're searching for "BPL" from California, Brooklyn shows up first, because it's closer to California.
         expected = ["Brooklyn Public Library", "Boston Public Library"]
-        assert [x[0].name for x in search("bpl", GeometryUtility.point(35, -118))] == expected
+        assert [x[0].name for x in search("bpl", CALIFORNIA)] == expected
 
         # If we're searching for "BPL" from Maine, Boston shows up first, because it's closer to Maine.
         expected = ["Boston Public Library", "Brooklyn Public Library"]
-        assert [x[0].name for x in search("bpl", GeometryUtility.point(43, -70))] == expected
+        assert [x[0].name for x in search("bpl", MAINE)] == expected
 
         # By default, search_by_library_name() only finds libraries in production.
         # Put them in the TESTING stage and they disappear.
-        for lib in (brooklyn, boston):
-            lib.registry_stage = Library.TESTING_STAGE
+        set_library_stages([brooklyn, boston], registry_stage=Library.TESTING_STAGE)
 
         assert search("bpl", production=True) == []
 
@@ -615,6 +718,12 @@ class TestLibraryModel:
         WHEN:
         THEN:
         """
+        # The fixtures committed, which expired these libraries. Reload both, with their service areas,
+        # places, and place aliases, up front instead of lazy-loading each of those below.
+        [kansas_state_library, nypl] = db_session.query(Library).options(
+            selectinload(Library.service_areas).selectinload(ServiceArea.place).selectinload(Place.aliases)
+        ).filter(Library.name.in_(["NYPL", "Kansas State Library"])).order_by(Library.name).all()
+
         # The NYPL explicitly covers New York City, which has 'Manhattan' as an alias.
         [nyc, zip_11212] = [x.place for x in nypl.service_areas]
         assert "Manhattan" in [x.name for x in nyc.aliases]
@@ -627,14 +736,14 @@ class TestLibraryModel:
 
         # A search for 'manhattan' finds both libraries.
         libraries = list(Library.search_by_location_name(db_session, "manhattan"))
-        assert set([x.name for x in libraries]) == set(["NYPL", "Kansas State Library"])
+        assert {x.name for x in libraries} == {"NYPL", "Kansas State Library"}
 
         # If you're searching from California, the Kansas library shows up first.
-        ca_results = Library.search_by_location_name(db_session, "manhattan", here=GeometryUtility.point(35, -118))
+        ca_results = Library.search_by_location_name(db_session, "manhattan", here=CALIFORNIA)
         assert [x[0].name for x in ca_results] == ["Kansas State Library", "NYPL"]
 
         # If you're searching from Maine, the New York library shows up first.
-        me_results = Library.search_by_location_name(db_session, "manhattan", here=GeometryUtility.point(43, -70))
+        me_results = Library.search_by_location_name(db_session, "manhattan", here=MAINE)
         assert [x[0].name for x in me_results] == ["NYPL", "Kansas State Library"]
 
         # We can insist that only certain types of places be considered as matching the name.
@@ -645,19 +754,35 @@ class TestLibraryModel:
         # A search for "Brooklyn" finds the NYPL, but it only finds it once, even though NYPL is
         # associated with two places called "Brooklyn": New York City and the ZIP code 11212
         [brooklyn_results] = Library.search_by_location_name(
-            db_session, "brooklyn", here=GeometryUtility.point(43, -70)
+            db_session, "brooklyn", here=MAINE
         )
         assert brooklyn_results[0] == nypl
 
         nypl.registry_stage = Library.TESTING_STAGE
         assert Library.search_by_location_name(
-            db_session, "brooklyn", here=GeometryUtility.point(43, -70), production=True
+            db_session, "brooklyn", here=MAINE, production=True
         ).all() == []
 
         assert Library.search_by_location_name(
-            db_session, "brooklyn", here=GeometryUtility.point(43, -70), production=False
+            db_session, "brooklyn", here=MAINE, production=False
         ).count() == 1
 
+    def test_search_loads_catalog_relationships(self, db_session, nypl, query_counter):
+        """
+        GIVEN: A production Library with hyperlinks and service areas
+        WHEN:  That Library is found by Library.search()
+        THEN:  Its service areas, places, hyperlinks, resources and validations should already be loaded,
+               so building a catalog entry for it sends no more queries
+        """
+        db_session.expire_all()
+        [(library, distance)] = Library.search(db_session, (40.7, -73.9), "nypl")
+        assert library is nypl
+
+        query_counter.clear()
+        assert [area.place.external_name for area in library.service_areas]
+        assert [(link.resource.href, link.resource.validation) for link in library.hyperlinks]
+        assert query_counter == []
+
     @pytest.mark.needsdocstring
     def test_search_within_description(self, db_session, create_test_library):
         """
@@ -676,7 +801,7 @@ class TestLibraryModel:
         assert results == [library]
 
     @pytest.mark.needsdocstring
-    def test_search(self, db_session, create_test_library, kansas_state, nypl):
+    def test_search(self, db_session, create_test_library, kansas_state, nypl, set_library_stages):
         """
         Test the overall search method.
 
@@ -692,8 +817,8 @@ class TestLibraryModel:
 
         # Even though NYPL is closer to the current location, the Kansas library showed up first
         # because it was a name match, as opposed to a service location match.
-        assert set([x[0].name for x in libraries]) == set(['Now Work', 'NYPL'])
-        assert set([int(x[1]/1000) for x in libraries]) == set([1768, 0])
+        assert {x[0].name for x in libraries} == {'Now Work', 'NYPL'}
+        assert {int(x[1]/1000) for x in libraries} == {1768, 0}
 
         # This search query has a Levenshtein distance of 1 from "New York", but a distance of 3
         # from "Now Work", so only NYPL shows up.
@@ -708,8 +833,7 @@ class TestLibraryModel:
         assert [x[0].name for x in libraries] == ['Now Work']
 
         # By default, search() only finds libraries in production.
-        nypl.registry_stage = Library.TESTING_STAGE
-        new_work.registry_stage = Library.TESTING_STAGE
+        set_library_stages([nypl, new_work], registry_stage=Library.TESTING_STAGE)
 
         def m(production):
             return len(
@@ -804,3 +928,64 @@ class TestLibraryModel:
         q = db_session.query(Library)
         assert q.filter(Library._feed_restriction(production=True)).all() == []
         assert q.filter(Library._feed_restriction(production=False)).all() == []
+
+
+class TestLibraryPureFunctions:
+    """Tests of Library static methods that work on strings alone, and need no database"""
+
+    @pytest.mark.needsdocstring
+    @pytest.mark.parametrize(
+        "input,output",
+        [
+            pytest.param("THE LIBRARY", "the library"),
+            pytest.param("\tthe   library\n\n", "the library"),
+            pytest.param("the libary", "the library"),
+        ]
+    )
+    def test_query_cleanup(self, input, output):
+        """
+        GIVEN:
+        WHEN:
+        THEN:
+        """
+        assert Library.query_cleanup(input) == output
+
+    @pytest.mark.needsdocstring
+    @pytest.mark.parametrize(
+        "input,output",
+        [
+            pytest.param("93203", "93203", id="us_zip"),
+            pytest.param("93203-1234", "93203", id="us_zip_plus_four"),
+            pytest.param("93203-12", None, id="us_zip_partial_plus_four"),
+            pytest.param("932031", None, id="six_digits"),
+            pytest.param("the library", None, id="non_postcode_string"),
+            pytest.param("AB1 0AA", None, id="uk_post_code"),
+        ]
+    )
+    def test_as_postal_code(self, input, output):
+        """
+        GIVEN:
+        WHEN:
+        THEN:
+        """
+        assert Library.as_postal_code(input) == output
+
+    @pytest.mark.needsdocstring
+    @pytest.mark.parametrize(
+        "input,output",
+        [
+            pytest.param("93203", (None, "93203", Place.POSTAL_CODE), id="us_zip"),
+            pytest.param("new york public library", ("new york public library", "new york", None), id="nypl"),
+            pytest.param("queens library", ("queens library", "queens", None), id="queens_library"),
+            pytest.param("kern county library", ("kern county library", "kern", Place.COUNTY), id="kern_county"),
+            pytest.param("new york state library", ("new york state library", "new york", Place.STATE), id="ny_state"),
+            pytest.param("lapl", ("lapl", "lapl", None), id="lapl"),
+        ]
+    )
+    def test_query_parts(self, input, output):
+        """
+        GIVEN:
+        WHEN:
+        THEN:
+        """
+        assert Library.query_parts(input) == output
@@ -1,6 +1,7 @@
 """
 Tests for the Resource, Hyperlink, and Validation models.
 """
+import time
 from datetime import datetime, timedelta
 
 import pytest
@@ -8,13 +9,10 @@ import pytest
 from library_registry.config import Configuration
 from library_registry.emailer import Emailer
 from library_registry.model import ConfigurationSetting, Hyperlink, Validation
-from library_registry.model_helpers import get_one_or_create
+from library_registry.model_helpers import generate_secret, get_one_or_create
 
-
-class TestResourceModel:
-    """
-    The Resource model is currently simple enough that it doesn't need unit tests.
-    """
+# How far back to start a Validation that should have expired: well past Validation.EXPIRES_AFTER.
+EXPIRED_AGE = timedelta(days=10)
 
 
 class MockEmailer(Emailer):
@@ -32,21 +30,90 @@ class MockEmailer(Emailer):
         return "http://librarysimplified.org/testurl"
 
 
+class FrozenClock:
+    """Stands in for the time module in library_registry.model, so a test decides what time it is."""
+    def __init__(self, now):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+    def advance(self, **kwargs):
+        """Move the clock forward by a duration given as timedelta keyword arguments."""
+        self.now += timedelta(**kwargs).total_seconds()
+
+    def utcnow(self):
+        return datetime.utcfromtimestamp(self.now)
+
+
+@pytest.fixture
+def frozen_clock(monkeypatch):
+    clock = FrozenClock(float(int(time.time())))     # A whole second, so started_at round-trips exactly
+    monkeypatch.setattr("library_registry.model.time", clock)
+    yield clock
+
+
+@pytest.fixture
+def emailer():
+    """A MockEmailer with nothing sent yet. Each test gets its own, so recorded calls never leak between tests."""
+    yield MockEmailer()
+
+
 @pytest.fixture
 def registry_contact_email(db_session):
+    """
+    The sitewide registry contact address that notify() puts in its emails.
+
+    The setting is only written inside the test's transaction, so it disappears with the
+    db_session rollback and needs no cleanup of its own.
+    """
     setting = ConfigurationSetting.sitewide(
         db_session,
         Configuration.REGISTRY_CONTACT_EMAIL
     )
     setting.value = "me@registry"
     yield setting
-    db_session.delete(setting)
-    db_session.commit()
+
+
+@pytest.fixture
+def designated_agent_link(db_session, create_test_library):
+    """A library's copyright designated agent Hyperlink, pointing at an email address."""
+    library = create_test_library(db_session)
+    library.web_url = "http://testlibrary"
+    (link, is_new) = library.set_hyperlink(
+        Hyperlink.COPYRIGHT_DESIGNATED_AGENT_REL, "serversidetest@librarysimplified.org"
+    )
+    assert is_new is True
+    yield link
+
+
+class TestResourceModel:
+    @pytest.mark.parametrize(
+        "href", ["mailto:me@library.org", "http://library.org/contact"], ids=["email", "http"]
+    )
+    def test_restart_validation(self, db_session, create_test_resource, frozen_clock, href):
+        """
+        GIVEN: A Resource with no Validation
+        WHEN:  .restart_validation() is called on it, and called again a day later
+        THEN:  The first call should create a Validation started at the current time, and the
+               second should restart that same Validation at the new current time
+        """
+        resource = create_test_resource(db_session, href=href)
+        assert resource.validation is None
+
+        validation = resource.restart_validation()
+        assert resource.validation is validation
+        assert validation.started_at == frozen_clock.utcnow()
+        assert validation.success is False
+
+        frozen_clock.advance(days=1)
+        assert resource.restart_validation() is validation
+        assert validation.started_at == frozen_clock.utcnow()
 
 
 class TestHyperlinkModel:
     def test_notify_exit_early(
-        self, db_session, create_test_resource, create_test_library, registry_contact_email
+        self, db_session, create_test_resource, create_test_library, registry_contact_email, emailer
     ):
         """
         GIVEN: A Hyperlink object
@@ -58,7 +125,6 @@ class TestHyperlinkModel:
         THEN:  The function should exit before doing any work
         """
         library = create_test_library(db_session)
-        emailer = MockEmailer()
         resource = create_test_resource(db_session)
         (hyperlink, _) = get_one_or_create(db_session, Hyperlink, rel="TESTREL")
 
@@ -89,8 +155,7 @@ class TestHyperlinkModel:
         db_session.commit()
 
     def test_notify_validated_resource(
-        self, db_session, create_test_library, create_test_resource, create_test_validation,
-        registry_contact_email
+        self, db_session, create_test_validation, registry_contact_email, designated_agent_link, emailer
     ):
         """
         GIVEN: - A Hyperlink instance which is associated with a Library and a Resource
@@ -100,22 +165,16 @@ class TestHyperlinkModel:
         THEN:  The Emailer's .sent() method should be called, with an email type of
                Emailer.ADDRESS_DESIGNATED.
         """
-        emailer = MockEmailer()
-        to_address = "serversidetest@librarysimplified.org"
-        library = create_test_library(db_session)
-        library.web_url = "http://testlibrary"
-
-        (link, is_new) = library.set_hyperlink(
-            Hyperlink.COPYRIGHT_DESIGNATED_AGENT_REL, to_address
-        )
-        assert is_new is True
+        link = designated_agent_link
+        (library_name, library_web_url) = (link.library.name, link.library.web_url)
+        to_address = link.resource.href
 
         validation = create_test_validation(
             db_session, link.resource, started_at=(datetime.utcnow() - timedelta(minutes=1))
         )
 
         assert link.resource.href == to_address
-        assert link.resource.validation == validation
+        assert link.resource.validation is validation
         assert link.resource.validation.success is False
 
         assert emailer.sent == []
@@ -128,8 +187,8 @@ class TestHyperlinkModel:
         assert email_type == Emailer.ADDRESS_DESIGNATED
         assert email_to == to_address
         assert template_vars['email'] == to_address
-        assert template_vars['library'] == library.name
-        assert template_vars['library_web_url'] == library.web_url
+        assert template_vars['library'] == library_name
+        assert template_vars['library_web_url'] == library_web_url
         assert template_vars['registry_support'] == registry_contact_email.value
         assert template_vars['rel_desc'] == Hyperlink.REL_DESCRIPTIONS[Hyperlink.COPYRIGHT_DESIGNATED_AGENT_REL]
 
@@ -140,10 +199,42 @@ class TestHyperlinkModel:
         db_session.delete(validation)
         db_session.commit()
 
-    def test_notify_no_validation(
-        self, db_session, create_test_library, create_test_resource, create_test_validation,
-        registry_contact_email
+    @pytest.mark.parametrize(
+        "elapsed,expected_email_type,restarted",
+        [
+            pytest.param(timedelta(hours=23), Emailer.ADDRESS_DESIGNATED, False, id="active_validation_kept"),
+            pytest.param(EXPIRED_AGE, Emailer.ADDRESS_NEEDS_CONFIRMATION, True, id="expired_validation_restarted"),
+        ]
+    )
+    def test_notify_pending_validation(
+        self, registry_contact_email, designated_agent_link, emailer, frozen_clock,
+        elapsed, expected_email_type, restarted
     ):
+        """
+        GIVEN: - A Hyperlink instance which is associated with a Library and a Resource
+                 whose href is an email address, and whose Validation has not yet succeeded
+               - A valid Emailer and a callable url_for
+        WHEN:  Some time passes, and then the .notify() method is called on the Hyperlink instance
+        THEN:  If the Validation is still active, it should be left alone and an
+               Emailer.ADDRESS_DESIGNATED email sent. If it has expired, it should be restarted
+               and an Emailer.ADDRESS_NEEDS_CONFIRMATION email sent.
+        """
+        link = designated_agent_link
+        validation = link.resource.restart_validation()
+        (started_at, secret) = (validation.started_at, validation.secret)
+
+        frozen_clock.advance(seconds=elapsed.total_seconds())
+        link.notify(emailer, emailer.url_for)
+
+        [(email_type, _, _)] = emailer.sent
+        assert email_type == expected_email_type
+        assert validation.active is True
+
+        expected_started_at = frozen_clock.utcnow() if restarted else started_at
+        assert validation.started_at == expected_started_at
+        assert (validation.secret == secret) is not restarted
+
+    def test_notify_no_validation(self, registry_contact_email, designated_agent_link, emailer):
         """
         GIVEN: - A Hyperlink instance which is associated with a Library and a Resource
                  whose href is an email address, and which does not have an associated
@@ -153,13 +244,7 @@ class TestHyperlinkModel:
         THEN:  The Emailer's .sent() method should be called, with an email type of
                Emailer.ADDRESS_NEEDS_CONFIRMATION.
         """
-        emailer = MockEmailer()
-        to_address = "serversidetest@librarysimplified.org"
-        library = create_test_library(db_session)
-        library.web_url = "http://testlibrary"
-
-        (link, is_new) = library.set_hyperlink(Hyperlink.COPYRIGHT_DESIGNATED_AGENT_REL, to_address)
-        assert is_new is True
+        link = designated_agent_link
 
         assert emailer.sent == []
         assert emailer.url_for_calls == []
@@ -173,13 +258,14 @@ class TestHyperlinkModel:
 
 
 @pytest.fixture(scope="function")
-def validation_obj(db_session, create_test_resource, create_test_validation):
-    r = create_test_resource(db_session)
-    v = create_test_validation(db_session, r)
-    yield v
-    db_session.delete(v)
-    db_session.delete(r)
-    db_session.commit()
+def validation_obj():
+    """
+    A fresh, unsaved Validation with the values its column defaults would give it on insert.
+
+    None of the Validation model tests need the object to be in the database, so it's never
+    written there, and there's nothing to clean up afterwards.
+    """
+    yield Validation(started_at=datetime.utcnow(), secret=generate_secret(), success=False)
 
 
 class TestValidationModel:
@@ -242,7 +328,7 @@ class TestValidationModel:
             validation_obj.mark_as_successful()
 
         validation_obj.success = False
-        validation_obj.started_at = datetime.utcnow() - timedelta(days=10)
+        validation_obj.started_at = datetime.utcnow() - EXPIRED_AGE
 
         with pytest.raises(Exception):
             validation_obj.mark_as_successful()
@@ -280,5 +366,32 @@ class TestValidationModel:
         assert validation_obj.active is False        # Success is now true, so not active
 
         validation_obj.success = False
-        validation_obj.started_at = datetime.utcnow() - timedelta(days=10)
+        validation_obj.started_at = datetime.utcnow() - EXPIRED_AGE
         assert validation_obj.active is False        # Success is false, but expiry has passed
+
+    def test_active_property_expires(self, validation_obj, frozen_clock):
+        """
+        GIVEN: A Validation object which was just restarted
+        WHEN:  The clock moves up to, and then past, its expiry time
+        THEN:  .active should be True until Validation.EXPIRES_AFTER has elapsed, and False after
+        """
+        validation_obj.restart()
+        assert validation_obj.started_at == frozen_clock.utcnow()
+
+        frozen_clock.advance(seconds=Validation.EXPIRES_AFTER_SECONDS - 1)
+        assert validation_obj.active is True
+
+        frozen_clock.advance(seconds=1)
+        assert validation_obj.active is False
+
+    def test_started_epoch_property(self, validation_obj):
+        """
+        GIVEN: A Validation object
+        WHEN:  That object's .started_at is changed
+        THEN:  .started_epoch should reflect the new value, treating started_at as UTC
+        """
+        validation_obj.started_at = datetime(2021, 1, 1, 12, 0, 0)
+        assert validation_obj.started_epoch == 1609502400.0
+
+        validation_obj.started_at = datetime(2021, 1, 2, 12, 0, 0)
+        assert validation_obj.started_epoch == 1609588800.0
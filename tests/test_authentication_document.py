@@ -16,6 +16,34 @@ from .mocks import MockPlace
 AuthDoc = AuthenticationDocument
 EVERYWHERE = AuthDoc.COVERAGE_EVERYWHERE
 
+# An Authentication For OPDS document demonstrating most of the features we're looking for.
+REAL_DOCUMENT = {
+    "id": "http://library/authentication-for-opds-file",
+    "title": "Ansonia Public Library",
+    "links": [
+        {"rel": "logo", "href": "data:image/png;base64,some-image-data", "type": "image/png"},
+        {"rel": "alternate", "href": "http://ansonialibrary.org", "type": "text/html"},
+        {"rel": "register", "href": "http://example.com/get-a-card/", "type": "text/html"},
+        {"rel": "start", "href": "http://catalog.example.com/", "type": "text/html/"},
+        {"rel": "start", "href": "http://opds.example.com/",
+         "type": "application/atom+xml;profile=opds-catalog"}
+    ],
+    "service_description": "Serving Ansonia, CT",
+    "color_scheme": "gold",
+    "collection_size": {"eng": 100, "spa": 20},
+    "public_key": "a public key",
+    "features": {"disabled": [], "enabled": ["https://librarysimplified.org/rel/policy/reservations"]},
+    "authentication": [
+        {
+            "type": "http://opds-spec.org/auth/basic",
+            "description": "Log in with your library barcode",
+            "inputs": {"login": {"keyboard": "Default"},
+                       "password": {"keyboard": "Default"}},
+            "labels": {"login": "Barcode", "password": "PIN"}
+        }
+    ]
+}
+
 
 @pytest.fixture
 def parse_places(db_session):
@@ -44,6 +72,16 @@ def parse_places(db_session):
 
 
 class TestParseCoverage:
+    @pytest.fixture(autouse=True)
+    def restore_mock_place(self):
+        """Undo any changes a test makes to MockPlace's class-level lookup state."""
+        saved_by_name = MockPlace.by_name.copy()
+        saved_default_nation = MockPlace._default_nation
+        yield
+        MockPlace.by_name.clear()
+        MockPlace.by_name.update(saved_by_name)
+        MockPlace._default_nation = saved_default_nation
+
     @pytest.mark.needsdocstring
     def test_universal_coverage(self, parse_places):
         """
@@ -55,54 +93,44 @@ class TestParseCoverage:
         """
         parse_places(EVERYWHERE, [MockPlace.EVERYWHERE])
 
-    @pytest.mark.needsdocstring
-    def test_entire_country(self, parse_places):
-        """
-        Test an authentication document that says a library covers an entire country.
-
-        GIVEN:
-        WHEN:
-        THEN:
-        """
-        us = MockPlace()
-        MockPlace.by_name["US"] = us
-        parse_places({"US": EVERYWHERE}, expected_places=[us])
-
-    @pytest.mark.needsdocstring
-    def test_ambiguous_country(self, parse_places):
-        """
-        Test the unlikely scenario where an authentication document says a library covers an
-        entire country, but it's ambiguous which country is being referred to.
-
-        GIVEN:
-        WHEN:
-        THEN:
-        """
-        canada = MockPlace()
-        MockPlace.by_name["CA"] = canada
-        MockPlace.by_name["Europe I think?"] = MockPlace.AMBIGUOUS
-        parse_places(
-            {"Europe I think?": EVERYWHERE, "CA": EVERYWHERE},
-            expected_places=[canada],
-            expected_ambiguous={"Europe I think?": EVERYWHERE}
-        )
-
-    @pytest.mark.needsdocstring
-    def test_unknown_country(self, parse_places):
+    @pytest.mark.parametrize(
+        "by_name,coverage,expected_names,expected_unknown,expected_ambiguous",
+        [
+            pytest.param(
+                {"US": MockPlace()},
+                {"US": EVERYWHERE},
+                ["US"], None, None,
+                id="entire_country",
+            ),
+            pytest.param(
+                {"CA": MockPlace(), "Europe I think?": MockPlace.AMBIGUOUS},
+                {"Europe I think?": EVERYWHERE, "CA": EVERYWHERE},
+                ["CA"], None, {"Europe I think?": EVERYWHERE},
+                id="ambiguous_country",
+            ),
+            pytest.param(
+                {"CA": MockPlace()},
+                {"Memory Alpha": EVERYWHERE, "CA": EVERYWHERE},
+                ["CA"], {"Memory Alpha": EVERYWHERE}, None,
+                id="unknown_country",
+            ),
+        ]
+    )
+    def test_country_coverage(
+        self, parse_places, by_name, coverage, expected_names, expected_unknown, expected_ambiguous
+    ):
         """
-        Test an authentication document that says a library covers an entire country, but
-        the library registry doesn't know anything about that country's geography.
-
-        GIVEN:
-        WHEN:
-        THEN:
+        GIVEN: An authentication document that says a library covers one or more entire countries
+        WHEN:  AuthenticationDocument.parse_coverage() is called on that coverage object
+        THEN:  Each known country is returned as a place, and any country the registry knows
+               nothing about, or can't tell apart from another, is reported as unknown or ambiguous
         """
-        canada = MockPlace()
-        MockPlace.by_name["CA"] = canada
+        MockPlace.by_name.update(by_name)
         parse_places(
-            {"Memory Alpha": EVERYWHERE, "CA": EVERYWHERE},
-            expected_places=[canada],
-            expected_unknown={"Memory Alpha": EVERYWHERE}
+            coverage,
+            expected_places=[by_name[name] for name in expected_names],
+            expected_unknown=expected_unknown,
+            expected_ambiguous=expected_ambiguous,
         )
 
     @pytest.mark.needsdocstring
@@ -182,7 +210,33 @@ class TestParseCoverage:
         MockPlace._default_nation = us
         parse_places("CA", expected_places=[ca])
         parse_places(["CA", "UT"], expected_places=[ca, ut])
-        MockPlace._default_nation = None
+
+    def test_service_and_focus_area_share_nation_lookups(self, monkeypatch):
+        """
+        GIVEN: A service area and a focus area that both name places within the same nation
+        WHEN:  AuthenticationDocument.parse_service_and_focus_area() is called on them
+        THEN:  The nation is looked up only once, and both areas resolve to places inside it
+        """
+        (p1, p2) = [MockPlace(), MockPlace()]
+        us = MockPlace(inside={"San Francisco": p1, "San Jose": p2})
+        MockPlace.by_name["US"] = us
+
+        lookups = []
+        original_lookup = MockPlace.lookup_one_by_name.__func__
+
+        def counting_lookup(cls, _db, name, place_type):
+            lookups.append(name)
+            return original_lookup(cls, _db, name, place_type)
+
+        monkeypatch.setattr(MockPlace, "lookup_one_by_name", classmethod(counting_lookup))
+
+        (service_area, focus_area) = AuthDoc.parse_service_and_focus_area(
+            None, {"US": ["San Francisco", "San Jose"]}, {"US": "San Francisco"}, MockPlace
+        )
+
+        assert lookups == ["US"]
+        assert service_area[0] == [p1, p2]
+        assert focus_area[0] == [p1]
 
 
 class TestLinkExtractor:
@@ -225,6 +279,26 @@ class TestLinkExtractor:
         # The type we prefer is not available, so we get the first link.
         assert AuthDoc._extract_link(links, 'alternate', prefer_type="application/xhtml+xml") == first_link
 
+    def test_index_links(self):
+        """
+        GIVEN: A list of links with a mix of link relations
+        WHEN:  AuthenticationDocument._index_links() is called on that list
+        THEN:  A dictionary should be returned mapping each link relation to its links, in document order
+        """
+        alternate_html = {"rel": "alternate", "href": "http://foo/", "type": "text/html"}
+        logo = {"rel": "logo", "href": "http://logo/"}
+        alternate_text = {"rel": "alternate", "href": "http://bar/", "type": "text/plain"}
+
+        assert AuthDoc._index_links([alternate_html, logo, alternate_text]) == {
+            "alternate": [alternate_html, alternate_text],
+            "logo": [logo],
+        }
+
+        # Missing or invalid links objects produce an empty index.
+        assert AuthDoc._index_links([]) == {}
+        assert AuthDoc._index_links(None) == {}
+        assert AuthDoc._index_links({"rel": "alternate"}) == {}
+
     @pytest.mark.needsdocstring
     def test_empty_document(self):
         """
@@ -257,6 +331,19 @@ class TestLinkExtractor:
         assert parsed.logo_link is None
         assert parsed.anonymous_access is False
 
+    def test_from_string_accepts_bytes(self):
+        """
+        GIVEN: An Authentication For OPDS document as raw bytes, as an HTTP client returns it
+        WHEN:  AuthenticationDocument.from_string() is called on it
+        THEN:  The document is parsed the same as its decoded string form would be
+        """
+        content = '{"id": "http://library/", "title": "Biblioth\u00e8que"}'
+        from_bytes = AuthDoc.from_string(None, content.encode("utf8"), MockPlace())
+        from_str = AuthDoc.from_string(None, content, MockPlace())
+
+        assert from_bytes.id == from_str.id == "http://library/"
+        assert from_bytes.title == from_str.title == "Bibliothèque"
+
     @pytest.mark.needsdocstring
     def test_real_document(self):
         """
@@ -266,35 +353,8 @@ class TestLinkExtractor:
         WHEN:
         THEN:
         """
-        document = {
-            "id": "http://library/authentication-for-opds-file",
-            "title": "Ansonia Public Library",
-            "links": [
-                {"rel": "logo", "href": "data:image/png;base64,some-image-data", "type": "image/png"},
-                {"rel": "alternate", "href": "http://ansonialibrary.org", "type": "text/html"},
-                {"rel": "register", "href": "http://example.com/get-a-card/", "type": "text/html"},
-                {"rel": "start", "href": "http://catalog.example.com/", "type": "text/html/"},
-                {"rel": "start", "href": "http://opds.example.com/",
-                 "type": "application/atom+xml;profile=opds-catalog"}
-            ],
-            "service_description": "Serving Ansonia, CT",
-            "color_scheme": "gold",
-            "collection_size": {"eng": 100, "spa": 20},
-            "public_key": "a public key",
-            "features": {"disabled": [], "enabled": ["https://librarysimplified.org/rel/policy/reservations"]},
-            "authentication": [
-                {
-                    "type": "http://opds-spec.org/auth/basic",
-                    "description": "Log in with your library barcode",
-                    "inputs": {"login": {"keyboard": "Default"},
-                               "password": {"keyboard": "Default"}},
-                    "labels": {"login": "Barcode", "password": "PIN"}
-                }
-            ]
-        }
-
         place = MockPlace()
-        parsed = AuthDoc.from_dict(None, document, place)
+        parsed = AuthDoc.from_dict(None, REAL_DOCUMENT, place)
 
         # Information about the OPDS server has been extracted from
         # JSON and put into the AuthenticationDocument object.
@@ -1229,7 +1229,7 @@ class TestLibraryRegistryController:
             # because it was generated using techniques designed for
             # cryptography which ignore seed(). But we do know how
             # long it is.
-            expect = 'UDAXIH'
+            expect = 'QAHFTR'
             assert expect == library.short_name
             assert len(library.shared_secret) == 48
 
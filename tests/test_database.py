@@ -0,0 +1,21 @@
+import pytest
+from sqlalchemy import inspect
+
+from library_registry.model import Base
+from tests.conftest import worker_schema
+
+
+class TestTestDatabase:
+    def test_worker_schema_has_tables(self, db_engine):
+        """
+        GIVEN: A test run spread across pytest-xdist workers
+        WHEN:  The test database has been initialized for this worker
+        THEN:  Every table should exist in the worker's own schema, not just in public
+        """
+        schema = worker_schema()
+        if not schema:
+            pytest.skip("Not running under pytest-xdist")
+
+        table_names = inspect(db_engine).get_table_names(schema=schema)
+        assert table_names
+        assert set(Base.metadata.tables) <= set(table_names)
@@ -58,7 +58,8 @@ class TestEmailTemplate:
 class MockSMTP:
     """Mock of smtplib.SMTP that records all incoming calls."""
 
-    calls = []
+    def __init__(self):
+        self.calls = []
 
     def __getattr__(self, method, *args, **kwargs):
         """When asked for a method, return a function that simply records the method call."""
@@ -70,7 +71,10 @@ class MockSMTP:
 
 class MockEmailer(Emailer):
     """Store outgoing emails in a list."""
-    emails = []
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.emails = []
 
     def _send_email(self, to_address, body, smtp):
         self.emails.append((to_address, body, smtp))
@@ -282,7 +286,7 @@ class TestEmailer:
         emailer.send("email1", "you@library", mock_smtp, arg="Value")
 
         # The template was filled out and passed into our mocked-up _send_email implementation.
-        (to, body, smtp) = emailer.emails.pop()
+        [(to, body, smtp)] = emailer.emails
         assert to == "you@library"
         for phrase in [
             "From: Me <me@registry>",
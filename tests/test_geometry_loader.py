@@ -156,3 +156,22 @@ class TestGeometryLoader:
             db_session.delete(place_obj)
 
         db_session.commit()
+
+    def test_load_new_place_repeated_alias(self, db_session, loader):
+        """
+        GIVEN: Metadata for a place that isn't in the database yet, which lists the same alias twice
+        WHEN:  That place is loaded
+        THEN:  The new place should get that alias once, alongside its other aliases
+        """
+        metadata = (
+            '{"parent_id": null, "name": "Lake Placid", "id": "3640508", "type": "city", '
+            '"aliases": [{"name": "Placid", "language": "eng"}, {"name": "Placid", "language": "eng"}, '
+            '{"name": "Lac Placide", "language": "fre"}]}'
+        )
+        geography = '{"type": "Point", "coordinates": [-73.98, 44.28]}'
+
+        (place, is_new) = loader.load(metadata, geography)
+        db_session.flush()
+
+        assert is_new is True
+        assert sorted((x.name, x.language) for x in place.aliases) == [("Lac Placide", "fre"), ("Placid", "eng")]
@@ -66,7 +66,7 @@ class TestLogConfiguration:
         assert isinstance(handlers[0].formatter, JSONFormatter)
 
     def test_from_configuration_with_loggly_integration(
-        self, db_session, create_test_external_integration, loggly_integration
+        self, db_session, create_test_external_integration, loggly_integration, query_counter
     ):
         # Let's set up a Loggly integration and change the defaults.
         internal = create_test_external_integration(
@@ -79,6 +79,8 @@ class TestLogConfiguration:
         internal.setting(LogConfiguration.DATABASE_LOG_LEVEL).value = LogConfiguration.DEBUG
         template = "%(filename)s:%(message)s"
         internal.setting(LogConfiguration.LOG_MESSAGE_TEMPLATE).value = template
+        db_session.flush()
+        query_counter.clear()
 
         (
             internal_log_level,
@@ -86,6 +88,10 @@ class TestLogConfiguration:
             handlers
         ) = LogConfiguration.from_configuration(db_session, testing=False)
 
+        # Both integrations and all of their settings are loaded together, rather than with a
+        # query per integration or per setting.
+        assert len(query_counter) <= 2, query_counter
+
         assert internal_log_level == LogConfiguration.ERROR
         assert database_log_level == LogConfiguration.DEBUG
         [loggly_handler] = [x for x in handlers if isinstance(x, LogglyHandler)]
@@ -16,6 +16,10 @@ class TestGeometryUtility(object):
         point = GeometryUtility.point_from_ip("127.0.0.1")
         assert point is None
 
+        # No IP address at all never reaches the GeoIP database.
+        assert GeometryUtility.point_from_ip(None) is None
+        assert GeometryUtility.point_from_ip("") is None
+
     def test_point_from_string(self):
         m = GeometryUtility.point_from_string
 
@@ -11,7 +11,7 @@ from library_registry.util.flask_util import (
 )
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def generic_app_obj():
     return Flask(__name__)
 
@@ -49,6 +49,8 @@ class TestFlaskUtil:
             pytest.param('10.0.0.1', '64.234.82.200', '64.234.82.200', id="ip_from_remote_addr"),
             pytest.param('10.0.0.1', '10.0.0.2', None, id="no_public_ip_provided"),
             pytest.param('64.234.82.200, 10.0.0.1', '64.234.82.201', '64.234.82.200', id="multival_Fwd4"),
+            pytest.param('10.0.0.1, 64.234.82.200', '64.234.82.201', '64.234.82.200', id="multival_Fwd4_private_first"),
+            pytest.param('2607:f8b0::1, 64.234.82.200', '10.0.0.2', '64.234.82.200', id="multival_Fwd4_ipv6_first"),
         ]
     )
     def test_originating_ip(self, generic_app_obj, fwd4_value, remote_addr, result):
@@ -81,6 +83,12 @@ class TestFlaskUtil:
             ('169.254.0.1', False),         # Link local
             ('255.255.255.255', False),     # Broadcast
             ('64.234.82.200', True),        # Public
+            ('172.31.255.255', False),      # Last address in a private range
+            ('172.32.0.0', True),           # First public address after a private range
+            ('192.0.2.1', False),           # Documentation
+            ('198.18.0.1', False),          # Benchmarking
+            ('223.255.255.255', True),      # Last public address before multicast
+            ('1.0.0.0', True),              # First public address
         ]
     )
     def test_is_public_ipv4_address(self, address, result):
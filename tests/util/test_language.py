@@ -1,3 +1,5 @@
+import sys
+
 import pytest
 
 from library_registry.util.language import LanguageCodes
@@ -16,7 +18,7 @@ class TestLanguageCodes:
         THEN:  The corresponding three letter language code will be returned
         """
         assert LanguageCodes.two_to_three[two_letter_code] == three_letter_code
-        assert LanguageCodes.two_to_three["nosuchlanguage"] is None
+        assert LanguageCodes.two_to_three.get("nosuchlanguage") is None
 
     @pytest.mark.parametrize(
         "two_letter_code,three_letter_code", [
@@ -30,41 +32,57 @@ class TestLanguageCodes:
         THEN:  The corresponding two letter language code will be returned
         """
         assert LanguageCodes.three_to_two[three_letter_code] == two_letter_code
-        assert LanguageCodes.three_to_two["nosuchlanguage"] is None
+        assert LanguageCodes.three_to_two.get("nosuchlanguage") is None
 
     @pytest.mark.parametrize(
         "key_name,eng_name_value", [
-            ("en", ["English"]),
-            ("spa", ["Spanish", "Castilian"]),
-            ("es", ["Spanish", "Castilian"]),
-            ("zh", ["Chinese"]),
-            ("chi", ["Chinese"]),
-            ("nosuchlanguage", [])
+            ("en", ("English",)),
+            ("spa", ("Spanish", "Castilian")),
+            ("es", ("Spanish", "Castilian")),
+            ("zh", ("Chinese",)),
+            ("chi", ("Chinese",)),
+            ("nosuchlanguage", ())
         ]
     )
     def test_english_names(self, key_name, eng_name_value):
         """
         GIVEN: A reference to the LanguageCodes class
-        WHEN:  The attribute 'english_names' is accessed as a dict with two or three letter keys
-        THEN:  The corresponding English name for the referenced language is returned
+        WHEN:  .english_names_for() is called with a two or three letter code
+        THEN:  The corresponding English names for the referenced language are returned
         """
-        assert LanguageCodes.english_names[key_name] == eng_name_value
+        assert LanguageCodes.english_names_for(key_name) == eng_name_value
 
     @pytest.mark.parametrize(
         "key_name,native_name_value", [
-            ("en", ["English"]),
-            ("eng", ["English"]),
-            ("es", ["español", "castellano"]),
-            ("spa", ["español", "castellano"]),
-            ("zh", []),
-            ("chi", []),
-            ("nosuchlanguage", [])
+            ("en", ("English",)),
+            ("eng", ("English",)),
+            ("es", ("español", "castellano")),
+            ("spa", ("español", "castellano")),
+            ("zh", ()),
+            ("chi", ()),
+            ("nosuchlanguage", ())
         ]
     )
     def test_native_names(self, key_name, native_name_value):
-        assert LanguageCodes.native_names[key_name] == native_name_value
+        assert LanguageCodes.native_names_for(key_name) == native_name_value
+
+    def test_lookups_do_not_grow_tables(self):
+        """
+        GIVEN: A reference to the LanguageCodes class
+        WHEN:  Unknown codes are looked up
+        THEN:  No entries are added to the lookup tables
+        """
+        sizes = [len(t) for t in (LanguageCodes.two_to_three, LanguageCodes.three_to_two,
+                                  LanguageCodes.english_names, LanguageCodes.native_names)]
+        LanguageCodes.english_names_for("nosuchlanguage")
+        LanguageCodes.native_names_for("nosuchlanguage")
+        LanguageCodes.iso_639_2_for_locale("nosuchlocale")
+        assert [len(t) for t in (LanguageCodes.two_to_three, LanguageCodes.three_to_two,
+                                 LanguageCodes.english_names, LanguageCodes.native_names)] == sizes
 
-    @pytest.mark.parametrize("locale,expected", [("en-US", "eng"), ("en", "eng"), ("en-GB", "eng")])
+    @pytest.mark.parametrize(
+        "locale,expected", [("en-US", "eng"), ("en", "eng"), ("en-GB", "eng"), ("spa", "spa"), ("ES-mx", "spa")]
+    )
     def test_locale(self, locale, expected):
         assert LanguageCodes.iso_639_2_for_locale(locale) == expected
         assert LanguageCodes.iso_639_2_for_locale("nosuchlocale") is None
@@ -100,3 +118,14 @@ class TestLanguageCodes:
 
         with pytest.raises(ValueError):
             LanguageCodes.name_for_languageset(["eng, nxx"])
+
+    def test_codes_are_interned(self):
+        """
+        GIVEN: Language codes built at runtime, as they would be parsed out of a request
+        WHEN:  They are converted to alpha-3 codes
+        THEN:  The codes returned are the tables' own interned strings
+        """
+        eng = "".join(["e", "n", "g"])
+        assert LanguageCodes.iso_639_2_for_locale(eng) is sys.intern("eng")
+        assert LanguageCodes.iso_639_2_for_locale("".join(["e", "n"])) is sys.intern("eng")
+        assert LanguageCodes.string_to_alpha_3("ENG") is sys.intern("eng")